@@ -0,0 +1,79 @@
+##Annotation cache##
+
+# Keeps the annotated turns (see annotates_corpus() in BME_Repetitions.py) on disk, in a SQLite file, so re-running the analysis
+# on the same transcripts doesn't need spaCy again.
+# - Turns are keyed by a hash of their normalised text (lowercase, single spaces) and of the spaCy model's name and version:
+#   the tokens only depend on these, as the tokeniser lowercases the turns and splits them on spaces.
+# - Every turn is stored as its sequence of (text, pos, open/closed) tokens.
+# - Once the cache holds more than max_entries turns, the least recently used ones are evicted.
+
+#imports#
+import hashlib # to hash the turns
+import json # to store the tokens
+import sqlite3 # for the cache file
+import time # to know which turns were used last
+
+
+class AnnotationCache:
+
+    def __init__(self, path, model_signature, max_entries=1000000):
+        self.path = path
+        self.model_signature = model_signature # name and version of the spaCy model, see models_signature() in BME_Repetitions.py
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        # waits for other processes writing to the same file; can be used from another thread (see counts_turn_async() in BME_Tracker.py).
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL") # so several processes can read while one writes.
+        self.connection.execute("CREATE TABLE IF NOT EXISTS annotations (key TEXT PRIMARY KEY, tokens TEXT, last_used REAL)")
+        self.evicts() # in case max_entries is lower than in previous runs.
+        self.connection.commit()
+
+    def keys(self, string): # key of a turn: hash of its normalised text and of the model.
+        normalised = " ".join(string.lower().split())
+        return(hashlib.sha1((self.model_signature + "\0" + normalised).encode("utf-8")).hexdigest())
+
+    def gets(self, strings): # returns the tokens of the turns already in the cache: {string: tokens}
+        keys = {}
+        for string in strings:
+            keys.setdefault(self.keys(string), []).append(string)
+
+        found = {}
+        key_list = list(keys)
+        for i in range(0, len(key_list), 500): # by groups, as SQLite limits the number of parameters of a query.
+            group = key_list[i:i+500]
+            rows = self.connection.execute(f"SELECT key, tokens FROM annotations WHERE key IN ({','.join('?' * len(group))})", group)
+            for key, tokens in rows:
+                for string in keys[key]:
+                    found[string] = tuple(tuple(token) for token in json.loads(tokens))
+
+        now = time.time()
+        self.connection.executemany("UPDATE annotations SET last_used = ? WHERE key = ?", [(now, key) for key in keys if keys[key][0] in found])
+        self.connection.commit()
+
+        self.hits += sum(len(keys[key]) for key in keys if keys[key][0] in found)
+        self.misses += sum(len(keys[key]) for key in keys if keys[key][0] not in found)
+        return(found)
+
+    def puts(self, annotated_turns): # adds new turns to the cache: {string: tokens}
+        now = time.time()
+        self.connection.executemany("INSERT OR REPLACE INTO annotations VALUES (?, ?, ?)",
+                                    [(self.keys(string), json.dumps(tokens), now) for string, tokens in annotated_turns.items()])
+        self.evicts()
+        self.connection.commit()
+
+    def evicts(self): # removes the least recently used turns beyond max_entries.
+        count = self.connection.execute("SELECT COUNT(*) FROM annotations").fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute("DELETE FROM annotations WHERE key IN (SELECT key FROM annotations ORDER BY last_used LIMIT ?)",
+                                    (count - self.max_entries,))
+
+    def stats(self):
+        total = self.hits + self.misses
+        return({"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0})
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,104 @@
+##Inverted n-gram index##
+
+# Indexes every n-gram of the B_ turns (see the BME method) while their repetitions are counted (see counts_repetitions() in
+# BME_Repetitions.py), so corpus-wide and long-distance questions don't need a pass over the output:
+# where was an n-gram first introduced, how often was it reused afterwards, how long did the other speakers take to align on it.
+# - Every n-gram (as a tuple of (text, pos, open/closed) tokens, as in the register) is mapped to its class (open "OC" or
+#   closed "CC") and to its postings: the (conversation, line, speaker, start time) of every turn it is in, in the order of the run.
+# - An n-gram can be queried as a tuple of tokens, or as a string of words ("i think"), which gathers all its POS variants.
+# - The index can be saved to and read from a SQLite file (one row per posting).
+
+#imports#
+import json # to store the n-grams
+import sqlite3 # for the index file
+
+
+class NgramIndex:
+
+    def __init__(self):
+        self.postings = {} # n-gram -> [(conversation, line, speaker, time), ...]
+        self.classes = {} # n-gram -> "OC" or "CC"
+        self.words = {} # words of the n-gram ("i think") -> [n-grams]
+        self.ranks = {} # conversation -> rank in the run
+
+    def adds(self, conversation, line, speaker, time, ngrams): # indexes the n-grams of a turn (every n-gram once per turn).
+        self.ranks.setdefault(conversation, len(self.ranks))
+        posting = (conversation, line, speaker, None if time is None or time != time else float(time)) # no time: None
+        for ngram in dict.fromkeys(ngrams):
+            if ngram not in self.postings:
+                self.postings[ngram] = []
+                self.classes[ngram] = "OC" if any(token[2] == "open" for token in ngram) else "CC"
+                self.words.setdefault(" ".join(token[0] for token in ngram), []).append(ngram)
+            self.postings[ngram].append(posting)
+
+    def merges(self, other): # adds the postings of another index, built on the conversations after this one's (e.g. by a worker).
+        for conversation in other.ranks:
+            self.ranks.setdefault(conversation, len(self.ranks))
+        for ngram, postings in other.postings.items():
+            if ngram not in self.postings:
+                self.postings[ngram] = []
+                self.classes[ngram] = other.classes[ngram]
+                self.words.setdefault(" ".join(token[0] for token in ngram), []).append(ngram)
+            self.postings[ngram].extend(postings)
+
+    def postings_of(self, ngram, conversation=None): # postings of an n-gram (tuple of tokens, or words), in the order of the run.
+        if isinstance(ngram, str):
+            postings = [posting for variant in self.words.get(" ".join(ngram.lower().split()), []) for posting in self.postings[variant]]
+            postings.sort(key=lambda posting: (self.ranks[posting[0]], posting[1]))
+        else:
+            postings = self.postings.get(tuple(tuple(token) for token in ngram), [])
+        if conversation is not None:
+            postings = [posting for posting in postings if posting[0] == conversation]
+        return(postings)
+
+    def first_occurrence(self, ngram, conversation=None): # first posting of the n-gram, in the corpus or in a conversation (None if never said).
+        postings = self.postings_of(ngram, conversation)
+        return(postings[0] if postings else None)
+
+    def reuse_count(self, ngram, conversation=None): # number of turns reusing the n-gram after its first occurrence (in the corpus or in a conversation):
+        # by the same speaker ("self") or another one ("other") in the conversation it was introduced in, and in other conversations.
+        postings = self.postings_of(ngram, conversation)
+        counts = {"self": 0, "other": 0, "other_conversations": 0}
+        if postings:
+            first_conversation, _, first_speaker, _ = postings[0]
+            for posting in postings[1:]:
+                if posting[0] != first_conversation:
+                    counts["other_conversations"] += 1
+                else:
+                    counts["self" if posting[2] == first_speaker else "other"] += 1
+        return(counts)
+
+    def alignment_lag(self, ngram, conversation): # lexical alignment: how long after its introduction another speaker first used the n-gram.
+        # Returns the speakers, and the lag in lines and in seconds (None without times), or None if no other speaker used it.
+        postings = self.postings_of(ngram, conversation)
+        if not postings:
+            return(None)
+        _, line, speaker, time = postings[0]
+        for _, other_line, other_speaker, other_time in postings[1:]:
+            if other_speaker != speaker:
+                return({"introduced_by": speaker, "aligned_by": other_speaker, "lines": other_line - line,
+                        "seconds": other_time - time if time is not None and other_time is not None else None})
+        return(None)
+
+    def writes(self, path): # saves the index in a SQLite file (replacing any index in it).
+        connection = sqlite3.connect(path)
+        connection.execute("DROP TABLE IF EXISTS postings")
+        connection.execute("CREATE TABLE postings (ngram TEXT, words TEXT, n INTEGER, class TEXT, conversation TEXT, line INTEGER, speaker TEXT, time REAL, rank INTEGER)")
+        connection.executemany("INSERT INTO postings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               ((json.dumps(ngram), " ".join(token[0] for token in ngram), len(ngram), self.classes[ngram],
+                                 str(conversation), int(line), speaker, time, self.ranks[conversation])
+                                for ngram, postings in self.postings.items() for conversation, line, speaker, time in postings))
+        connection.execute("CREATE INDEX postings_words ON postings (words)")
+        connection.commit()
+        connection.close()
+
+    @classmethod
+    def reads(cls, path): # reads an index saved by writes().
+        index = cls()
+        connection = sqlite3.connect(path)
+        for ngram, conversation, line, speaker, time, rank in connection.execute("SELECT ngram, conversation, line, speaker, time, rank FROM postings ORDER BY rank, line, rowid"):
+            ngram = tuple(tuple(token) for token in json.loads(ngram))
+            index.ranks.setdefault(conversation, rank)
+            index.adds(conversation, line, speaker, time, [ngram])
+        connection.close()
+        return(index)
@@ -0,0 +1,95 @@
+##Instrumentation##
+
+# Measures where the time goes in a run of BME_Repetitions.py or BME_Matrix.py, and reports it as JSON at the end of the run:
+# - per stage (normalize, tag, ngrams, register, jaccard, fill, write, and matrix in BME_Matrix.py): wall time and number of calls. The time of a stage
+#   doesn't include the stages run inside it (the time of a stage run inside another one only counts towards the inner one);
+# - per conversation: number of turns, time spent counting their repetitions, and throughput in turns/s;
+# - optionally, a cProfile of the whole run (the 30 functions with the longest cumulative time).
+# The instruments are off by default, so the stages cost nothing when no report is asked for.
+
+#imports#
+import contextlib # for the stages
+import cProfile # for the optional profile
+import io # to read the profile
+import json # for the report
+import pstats # to read the profile
+import time # to time the stages
+
+
+class Instruments:
+
+    def __init__(self):
+        self.enabled = False
+        self.resets()
+
+    def resets(self):
+        self.stages = {} # stage -> {"seconds": ..., "calls": ...}
+        self.conversations = {} # conversation -> {"turns": ..., "seconds": ...}
+        self.nested = [] # time spent in the stages run inside the current ones
+        self.profiler = None
+        self.started = time.perf_counter()
+
+    def stage(self, name): # context timing a stage, e.g. with instruments.stage("tag"): ...
+        if not self.enabled:
+            return(contextlib.nullcontext())
+        return(self.times(name))
+
+    @contextlib.contextmanager
+    def times(self, name):
+        self.nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self.nested.pop()
+            if self.nested:
+                self.nested[-1] += elapsed
+            stage = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+            stage["seconds"] += elapsed - nested
+            stage["calls"] += 1
+
+    def records_conversation(self, conversation, turns, seconds):
+        if self.enabled:
+            record = self.conversations.setdefault(str(conversation), {"turns": 0, "seconds": 0.0})
+            record["turns"] += turns
+            record["seconds"] += seconds
+
+    def merges(self, report): # adds the report of another process (e.g. a worker, see runs_pipeline()).
+        for name, stage in report["stages"].items():
+            merged = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+            merged["seconds"] += stage["seconds"]
+            merged["calls"] += stage["calls"]
+        for record in report["conversations"]:
+            self.records_conversation(record["conversation"], record["turns"], record["seconds"])
+
+    def starts_profile(self):
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stops_profile(self, path=None): # returns the 30 functions with the longest cumulative time, and saves the whole profile to path.
+        self.profiler.disable()
+        if path:
+            self.profiler.dump_stats(path)
+        output = io.StringIO()
+        pstats.Stats(self.profiler, stream=output).sort_stats("cumulative").print_stats(30)
+        self.profiler = None
+        return(output.getvalue().splitlines())
+
+    def report(self):
+        conversations = [{"conversation": conversation,
+                          "turns": record["turns"],
+                          "seconds": record["seconds"],
+                          "turns_per_second": record["turns"] / record["seconds"] if record["seconds"] else None}
+                         for conversation, record in self.conversations.items()]
+        return({"stages": self.stages,
+                "conversations": conversations,
+                "seconds": time.perf_counter() - self.started,
+                "turns": sum(record["turns"] for record in conversations)})
+
+    def writes(self, path, **extra): # writes the report, with any extra information (e.g. the cache's hits and misses).
+        with open(path, "w") as file:
+            json.dump(dict(self.report(), **extra), file, indent=2)
+
+
+instruments = Instruments() # instruments of the run (every worker process has its own).
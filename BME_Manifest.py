@@ -0,0 +1,79 @@
+##Manifest of an output##
+
+# Records what an output of BME_Repetitions.py was computed from, so a re-run only recomputes the conversations that changed
+# (see runs_incremental() in BME_Repetitions.py).
+# - The input is split in conversations: blocks of consecutive lines with the same conversation ID (a conversation appearing in
+#   several blocks is keyed "<ID>#2", "<ID>#3"... from its second block on).
+# - Every conversation is hashed from the columns its repetitions are computed from (conversation ID, Tag_Turn_ and BME_Turn_
+#   of every speaker, and the STT_Turn_/ETT_Turn_ times for a window in seconds), along with its lines in the output.
+# - The settings of the run (n-gram sizes, speakers, window, spaCy model...) are hashed as well: if they change, everything is recomputed.
+# - So is the output file itself: if it was rewritten since (e.g. by a run that wasn't incremental), everything is recomputed.
+# The manifest is a JSON file, next to the output by default (<output>.manifest.json).
+
+#imports#
+import hashlib # to hash the conversations and the settings
+import json # for the manifest file
+import os # to know whether the manifest and the output exist
+import pandas as pd # for dataframes
+
+
+# splits_blocks() returns the conversations of the dataframe as {key: (first line, last line + 1)}, in their order.
+def splits_blocks(df, conversation_column):
+    conversations = df[conversation_column].to_numpy()
+    starts = [i for i in range(len(df)) if i == 0 or conversations[i] != conversations[i-1]]
+    blocks, seen = {}, {}
+    for start, stop in zip(starts, starts[1:] + [len(df)]):
+        ID = str(conversations[start])
+        seen[ID] = seen.get(ID, 0) + 1
+        blocks[ID if seen[ID] == 1 else ID+"#"+str(seen[ID])] = (start, stop)
+    return(blocks)
+
+
+# hashes_block() hashes the given columns of a block of lines (their values, not the index of the lines).
+def hashes_block(block):
+    return(hashlib.sha1(pd.util.hash_pandas_object(block, index=False).to_numpy().tobytes()).hexdigest())
+
+
+# hashes_file() hashes the content of a file, read by blocks of 1 MB.
+def hashes_file(path):
+    file_hash = hashlib.sha1()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(2**20), b""):
+            file_hash.update(block)
+    return(file_hash.hexdigest())
+
+
+# hashes_settings() hashes the settings of a run (any JSON-serialisable values).
+def hashes_settings(**settings):
+    return(hashlib.sha1(json.dumps(settings, sort_keys=True, default=str).encode("utf-8")).hexdigest())
+
+
+class Manifest:
+
+    def __init__(self, path):
+        self.path = path
+        self.settings = None # hash of the settings of the run
+        self.output = None # hash of the output file
+        self.conversations = {} # key -> {"hash": ..., "start": first line in the output, "stop": last line + 1}
+        if os.path.exists(path):
+            with open(path) as file:
+                manifest = json.load(file)
+            self.settings = manifest["settings"]
+            self.output = manifest.get("output")
+            self.conversations = manifest["conversations"]
+
+    def changes(self, settings, hashes, output): # returns the keys of the conversations to recompute in the output file.
+        if settings != self.settings or not os.path.exists(output) or hashes_file(output) != self.output:
+            return(set(hashes))
+        return({key for key in hashes if key not in self.conversations or self.conversations[key]["hash"] != hashes[key]})
+
+    def invalidates(self): # removes the manifest file, while its output is being rewritten.
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def writes(self, settings, hashes, blocks, output): # records the settings and the conversations of the output file just written.
+        self.settings = settings
+        self.output = hashes_file(output)
+        self.conversations = {key: {"hash": hashes[key], "start": blocks[key][0], "stop": blocks[key][1]} for key in blocks}
+        with open(self.path, "w") as file:
+            json.dump({"settings": self.settings, "output": self.output, "conversations": self.conversations}, file, indent=1)
@@ -0,0 +1,353 @@
+##Turn-by-turn matrices##
+
+# Compares every B_ turn (see the BME method) with every other turn of its conversation at once, with sparse matrices (needs scipy),
+# rather than one pair of n-gram sets at a time:
+# - for every n-gram size and class (all "", open "OC", closed "CC"), the turns of a conversation are rows of a binary
+#   turn x n-gram incidence matrix B (the n-gram sets the register would keep), and a count matrix W (the n-grams of the turns
+#   as counted by counts_rep(), duplicates included);
+# - all the pairwise intersections are a single sparse product B.Bt, from which the Jaccard indexes are derived with the row sums
+#   (|A n B| / (|A| + |B| - |A n B|)), split in "self" (pairs of turns of the same speaker) and "other" matrices;
+# - with minhash=K, every turn is sketched by K min-hashes of its n-grams instead, computed straight from the annotated turns
+#   (memory bounded by the number of turns times K, for very long conversations). The pairs of turns are only compared on request:
+#   with a threshold, the pairs likely to reach it are found by LSH banding, and their Jaccard indexes estimated from the min-hashes;
+# - the previous-turn metrics of counts_repetitions() come out of the same matrices: every turn's register is the rows of its
+#   previous turns in B (one sparse product with a turn x turn selection matrix), compared with its row in W. For a turn whose
+#   counted n-grams are all different (same rows in W and B), its "self" Jaccard index is the (turn, previous turn) entry of the pairwise matrix.
+
+# Usage: python BME_Matrix.py --input input_example.csv --output matrices.npz --ngrams 1 3 [--minhash 128 [--threshold 0.5]] [--report report.json]
+
+#imports#
+import argparse # for the command line
+import numpy as np # for the matrices
+import pandas as pd # for dataframes
+import zlib # to hash the n-grams for the min-hashes
+from BME_Repetitions import annotates_corpus, models_signature
+from BME_Cache import AnnotationCache # to keep the annotated turns from one run to another
+from BME_Manifest import splits_blocks # to split the dataframe in conversations
+from BME_Instruments import instruments # to measure where the time goes
+# scipy is only imported once matrices are built, see imports_sparse().
+
+
+PRIME = 2**31 - 1 # modulus of the min-hashes
+
+
+# imports_sparse() imports scipy.sparse, which the matrix mode needs (scipy is optional for the rest of the code).
+def imports_sparse():
+    try:
+        import scipy.sparse # for the sparse matrices
+    except(ImportError):
+        raise ImportError("the matrix mode needs scipy (pip install scipy)")
+    return(scipy.sparse)
+
+
+# lists_turns() lists the B_ turns of a conversation in the order they are counted: by line, then by speaker.
+def lists_turns(df, speakers):
+    bme_turns = {ID: df["BME_Turn_"+ID].to_numpy() for ID in speakers}
+    return([(l, ID) for i, l in enumerate(df.index) for ID in speakers if bme_turns[ID][i] in ["B_W", "B_M"]])
+
+
+# incidence_matrices() builds, for every class, the count matrix W and the binary incidence matrix B of the turns (see above).
+# As counts_rep() lists an n-gram under "CC" for each of its tokens before the first open one, and under "OC" for the others,
+# its counts in W are weighted accordingly.
+# Returns {C: (W, B)}, with the n-grams of the turns as columns.
+def incidence_matrices(turns, annotated_turns, ngram):
+    sparse = imports_sparse()
+    columns, leading_closed = {}, [] # n-gram -> column, column -> number of closed tokens before the first open one
+    rows, cols = [], []
+
+    for k, (l, ID) in enumerate(turns):
+        tokens = annotated_turns[ID][l]
+        for i in range(len(tokens) - (ngram-1)):
+            item = tuple(tokens[i:i+ngram])
+            column = columns.get(item)
+            if column is None:
+                column = columns[item] = len(leading_closed)
+                leading_closed.append(next((t for t, token in enumerate(item) if token[2] == "open"), ngram))
+            rows.append(k)
+            cols.append(column)
+
+    shape = (len(turns), len(leading_closed))
+    rows, cols = np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)
+    leading_closed = np.array(leading_closed, dtype=np.int64)
+    is_open = leading_closed < ngram
+
+    weights = {"": np.ones(len(cols), dtype=np.int64), "CC": leading_closed[cols], "OC": ngram - leading_closed[cols]}
+    matrices = {}
+    for C in ["", "OC", "CC"]:
+        W = sparse.csr_matrix((weights[C], (rows, cols)), shape=shape) # duplicates are summed
+        W.eliminate_zeros()
+        B = sparse.csr_matrix((np.ones(len(cols), dtype=np.int64), (rows, cols)), shape=shape)
+        B.data[:] = 1
+        if C:
+            B = B.multiply((is_open if C == "OC" else ~is_open)[None, :].astype(np.int64)).tocsr()
+            B.eliminate_zeros()
+        matrices[C] = (W, B)
+    return(matrices)
+
+
+# selects_registers() builds the turn x turn matrices selecting, for every turn, the turns in its register (see Register):
+# the last `window` turns of the same speaker ("self"), and of every other speaker ("other"), before it.
+def selects_registers(turns, window=1):
+    sparse = imports_sparse()
+    previous = {} # speaker's ID -> turns so far
+    selected = {"self": ([], []), "other": ([], [])}
+    for k, (_, ID) in enumerate(turns):
+        for participant, ks in previous.items():
+            p = "self" if participant == ID else "other"
+            for j in (ks[-window:] if window else ks):
+                selected[p][0].append(k)
+                selected[p][1].append(j)
+        previous.setdefault(ID, []).append(k)
+    return({p: sparse.csr_matrix((np.ones(len(selected[p][0]), dtype=np.int64), selected[p]), shape=(len(turns), len(turns)))
+            for p in ["self", "other"]})
+
+
+# jaccard_matrix() returns the Jaccard indexes of all pairs of rows of a binary matrix, as a sparse matrix (pairs sharing nothing are left out).
+def jaccard_matrix(B):
+    intersections = (B @ B.T).tocoo()
+    sizes = np.asarray(B.sum(axis=1)).ravel()
+    jaccard = intersections.data / (sizes[intersections.row] + sizes[intersections.col] - intersections.data)
+    return(imports_sparse().csr_matrix((jaccard, (intersections.row, intersections.col)), shape=intersections.shape))
+
+
+# minhash_signatures() returns `permutations` min-hashes of the n-grams of every turn, for every class: {C: turns x permutations array}
+# (PRIME for a turn without any n-gram of the class). The n-grams are hashed from the annotated turns, without any incidence
+# matrix, and by blocks of turns, so the memory used is bounded by the number of turns times the number of permutations.
+def minhash_signatures(turns, annotated_turns, ngram, permutations=128, seed=0, block=1000):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, PRIME, permutations, dtype=np.int64)
+    b = rng.integers(0, PRIME, permutations, dtype=np.int64)
+    signatures = {C: np.full((len(turns), permutations), PRIME, dtype=np.int64) for C in ["", "OC", "CC"]}
+
+    for start in range(0, len(turns), block):
+        rows, values, is_open = [], [], [] # one line per distinct n-gram of every turn of the block
+        for k, (l, ID) in enumerate(turns[start:start+block]):
+            tokens = annotated_turns[ID][l]
+            for item in dict.fromkeys(tuple(tokens[i:i+ngram]) for i in range(len(tokens) - (ngram-1))):
+                rows.append(k)
+                values.append(zlib.crc32("\x1f".join(token[0]+"/"+token[1] for token in item).encode("utf-8")))
+                is_open.append(any(token[2] == "open" for token in item))
+        if not rows:
+            continue
+        rows, is_open = np.array(rows, dtype=np.int64), np.array(is_open)
+        hashes = (a * np.array(values, dtype=np.int64)[:, None] + b) % PRIME
+        for C, selected in [("", np.ones(len(rows), dtype=bool)), ("OC", is_open), ("CC", ~is_open)]:
+            if selected.any():
+                selected_rows = rows[selected]
+                firsts = np.flatnonzero(np.r_[True, selected_rows[1:] != selected_rows[:-1]]) # first n-gram of every turn
+                signatures[C][start + selected_rows[firsts]] = np.minimum.reduceat(hashes[selected], firsts, axis=0)
+    return(signatures)
+
+
+# similar_pairs() returns the pairs of turns whose Jaccard index, estimated from their min-hashes (share of equal min-hashes),
+# is at least `threshold`, as a sparse matrix (both orders, and every turn with itself; turns without n-grams are left out).
+# Only the candidate pairs are compared: the min-hashes are split in bands of `rows` min-hashes, and two turns are candidates
+# if all the min-hashes of one of their bands are equal (LSH banding, with bands and rows chosen so (1/bands)^(1/rows) ~ threshold).
+def similar_pairs(signatures, threshold, chunk=2**16):
+    sparse = imports_sparse()
+    turns, permutations = signatures.shape
+    bands = min(range(1, permutations + 1), key=lambda bands: abs((1 / bands) ** (1 / (permutations // bands)) - threshold))
+    rows = permutations // bands
+    nonempty = np.flatnonzero(signatures[:, 0] != PRIME)
+
+    candidates = [nonempty * turns + nonempty] # every turn with itself
+    for band in range(bands):
+        _, buckets = np.unique(signatures[nonempty, band*rows:(band+1)*rows], axis=0, return_inverse=True)
+        buckets = buckets.ravel()
+        order = np.argsort(buckets, kind="stable")
+        bounds = np.flatnonzero(np.diff(buckets[order])) + 1
+        for members in np.split(nonempty[order], bounds):
+            if len(members) > 1:
+                i, j = np.triu_indices(len(members), 1)
+                candidates.append(members[i] * turns + members[j])
+    candidates = np.unique(np.concatenate(candidates))
+
+    pairs, estimates = [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))], [np.zeros(0)]
+    for start in range(0, len(candidates), chunk):
+        i, j = np.divmod(candidates[start:start+chunk], turns)
+        estimate = (signatures[i] == signatures[j]).mean(axis=1)
+        kept = estimate >= threshold
+        pairs.append((i[kept], j[kept]))
+        estimates.append(estimate[kept])
+    i, j = np.concatenate([pair[0] for pair in pairs]), np.concatenate([pair[1] for pair in pairs])
+    estimates = np.concatenate(estimates)
+    different = i != j
+    return(sparse.csr_matrix((np.r_[estimates, estimates[different]], (np.r_[i, j[different]], np.r_[j, i[different]])), shape=(turns, turns)))
+
+
+# splits_speakers() splits a turn x turn matrix in the pairs of turns of the same speaker ("self") and of different speakers ("other").
+def splits_speakers(matrix, turn_speakers):
+    sparse = imports_sparse()
+    matrix = matrix.tocoo()
+    same_speaker = turn_speakers[matrix.row] == turn_speakers[matrix.col]
+    return({p: sparse.csr_matrix((matrix.data[pairs], (matrix.row[pairs], matrix.col[pairs])), shape=matrix.shape)
+            for p, pairs in [("self", same_speaker), ("other", ~same_speaker)]})
+
+
+# turn_matrices() computes the turn x turn Jaccard matrices of every conversation, for all n-gram sizes and classes, split in
+# self and other. Exactly, the incidence matrices are built once for the whole dataframe, and each conversation is a block of their rows.
+# With minhash=K, every conversation is sketched by K min-hashes of its turns instead, and with a threshold, the matrices only hold
+# the pairs of turns whose estimated Jaccard index reaches it (see similar_pairs()); without one, no pair is compared.
+# Returns {conversation: {"turns": dataframe of the line and speaker of every turn, "matrices": {(n, C, p): sparse matrix},
+#                         "signatures": {(n, C): turns x K min-hashes} (with minhash)}}
+def turn_matrices(df, annotated_turns, ngram_sizes, speakers=("MOD", "P1", "P2"), conversation_column="Conv_MOD_P1_P2", minhash=None, seed=0, threshold=None):
+    turns, blocks = [], {} # all the turns, and the turns of every conversation (first turn, last turn + 1)
+    for conversation, (start, stop) in splits_blocks(df, conversation_column).items():
+        block_turns = lists_turns(df.iloc[start:stop], speakers)
+        blocks[conversation] = (len(turns), len(turns) + len(block_turns))
+        turns += block_turns
+    turn_speakers = np.array([ID for _, ID in turns], dtype=object)
+
+    results = {conversation: {"turns": pd.DataFrame({"line": [l for l, _ in turns[first:last]], "speaker": turn_speakers[first:last]}),
+                              "matrices": {}, "signatures": {}}
+               for conversation, (first, last) in blocks.items()}
+
+    with instruments.stage("matrix"):
+        for ngram in ngram_sizes:
+            if minhash:
+                for conversation, (first, last) in blocks.items():
+                    for C, signatures in minhash_signatures(turns[first:last], annotated_turns, ngram, minhash, seed).items():
+                        results[conversation]["signatures"][(ngram, C)] = signatures
+                        if threshold is not None:
+                            for p, matrix in splits_speakers(similar_pairs(signatures, threshold), turn_speakers[first:last]).items():
+                                results[conversation]["matrices"][(ngram, C, p)] = matrix
+            else:
+                for C, (_, B) in incidence_matrices(turns, annotated_turns, ngram).items():
+                    for conversation, (first, last) in blocks.items():
+                        for p, matrix in splits_speakers(jaccard_matrix(B[first:last]), turn_speakers[first:last]).items():
+                            results[conversation]["matrices"][(ngram, C, p)] = matrix
+
+    return(results)
+
+
+# previous_turn_metrics() computes the repeated, nonrepeated, length and jaccard_index columns of counts_repetitions() (with a
+# window of `window` turns) from the same matrices: the register of every turn is selected from B, and compared with W.
+# As the registers never cross conversations, the selections of all conversations make a single block-diagonal matrix, and
+# the whole dataframe is computed with one product per n-gram size, class and self/other.
+# The columns are the same as counts_repetitions()'s (without the repeated n-grams), with the same values.
+def previous_turn_metrics(df, annotated_turns, ngram_sizes, speakers=("MOD", "P1", "P2"), conversation_column="Conv_MOD_P1_P2", window=1):
+    sparse = imports_sparse()
+    columns = {}
+    for ngram in ngram_sizes:
+        for ID in speakers:
+            for C in ["", "OC", "CC"]:
+                for p in ["self", "other"]:
+                    for rep in ["repeated", "nonrepeated", "length", "jaccard_index"]:
+                        name = ID+"_"+C+"_"+p+"_"+rep+"_"+str(ngram)+"n"
+                        columns[name] = np.zeros(len(df), dtype=np.int64) if rep == "length" else np.full(len(df), "", dtype=object)
+
+    turns, selections = [], {"self": [], "other": []}
+    for start, stop in splits_blocks(df, conversation_column).values():
+        block_turns = lists_turns(df.iloc[start:stop], speakers)
+        if block_turns:
+            turns += block_turns
+            for p, selection in selects_registers(block_turns, window).items():
+                selections[p].append(selection)
+    if not turns:
+        return(pd.DataFrame(columns, index=df.index))
+
+    selections = {p: sparse.block_diag(selections[p], format="csr") for p in selections}
+    rows = pd.Series(np.arange(len(df)), index=df.index)[[l for l, _ in turns]].to_numpy() # line of every turn
+    turn_speakers = np.array([ID for _, ID in turns], dtype=object)
+
+    with instruments.stage("matrix"):
+        for ngram in ngram_sizes:
+            for C, (W, B) in incidence_matrices(turns, annotated_turns, ngram).items():
+                length = np.asarray(W.sum(axis=1)).ravel()
+                for p in ["self", "other"]:
+                    register = selections[p] @ B # n-grams of the register of every turn
+                    register.data[:] = 1
+                    repeated = np.asarray(W.multiply(register).sum(axis=1)).ravel()
+                    found = np.asarray((W > 0).multiply(register).sum(axis=1)).ravel() # distinct n-grams repeated
+                    available = np.asarray(register.sum(axis=1)).ravel()
+                    denominator = available + length - repeated
+                    jaccard = (repeated / np.where(denominator > 0, denominator, 1)).astype(object)
+                    jaccard[denominator == 0] = 0 # 0 if no n-gram at all.
+
+                    for ID in speakers:
+                        mine = turn_speakers == ID
+                        name = ID+"_"+C+"_"+p+"_{}_"+str(ngram)+"n"
+                        columns[name.format("repeated")][rows[mine]] = repeated[mine]
+                        columns[name.format("nonrepeated")][rows[mine]] = (available - found)[mine]
+                        columns[name.format("length")][rows[mine]] = length[mine]
+                        columns[name.format("jaccard_index")][rows[mine]] = jaccard[mine]
+
+    return(pd.DataFrame(columns, index=df.index))
+
+
+# writes_matrices() saves the matrices of turn_matrices() in a compressed .npz file: for every conversation, the lines and
+# speakers of its turns ("<conversation>/line", "<conversation>/speaker"), the sparse matrices as CSR arrays
+# ("<conversation>/<n>/<all, OC or CC>/<self or other>/data", ".../indices", ".../indptr", ".../shape"), and the min-hashes, if any
+# ("<conversation>/<n>/<all, OC or CC>/signatures").
+def writes_matrices(path, results):
+    arrays = {}
+    for conversation, result in results.items():
+        arrays[f"{conversation}/line"] = result["turns"]["line"].to_numpy()
+        arrays[f"{conversation}/speaker"] = result["turns"]["speaker"].to_numpy().astype(str)
+        for (ngram, C, p), matrix in result["matrices"].items():
+            key = f"{conversation}/{ngram}/{C or 'all'}/{p}"
+            arrays[key+"/data"], arrays[key+"/indices"], arrays[key+"/indptr"] = matrix.data, matrix.indices, matrix.indptr
+            arrays[key+"/shape"] = np.array(matrix.shape)
+        for (ngram, C), signatures in result["signatures"].items():
+            arrays[f"{conversation}/{ngram}/{C or 'all'}/signatures"] = signatures
+    np.savez_compressed(path, **arrays)
+
+
+# reads_matrices() reads the matrices saved by writes_matrices(), as returned by turn_matrices().
+def reads_matrices(path):
+    sparse = imports_sparse()
+    results = {}
+    with np.load(path) as arrays:
+        for key in arrays.files:
+            parts = key.split("/")
+            result = results.setdefault(parts[0], {"turns": pd.DataFrame(), "matrices": {}, "signatures": {}})
+            if len(parts) == 2:
+                result["turns"][parts[1]] = arrays[key]
+            elif parts[-1] == "signatures":
+                result["signatures"][(int(parts[1]), "" if parts[2] == "all" else parts[2])] = arrays[key]
+            elif parts[-1] == "data":
+                prefix = "/".join(parts[:-1])
+                result["matrices"][(int(parts[1]), "" if parts[2] == "all" else parts[2], parts[3])] = sparse.csr_matrix(
+                    (arrays[prefix+"/data"], arrays[prefix+"/indices"], arrays[prefix+"/indptr"]), shape=tuple(arrays[prefix+"/shape"]))
+    return(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Computes the turn x turn Jaccard matrices of every conversation of a BME file (needs scipy).")
+    parser.add_argument("-i", "--input", default="input_example.csv", help="input csv file (default: %(default)s)")
+    parser.add_argument("-o", "--output", default="matrices.npz", help="output .npz file (default: %(default)s)")
+    parser.add_argument("--ngrams", nargs=2, type=int, default=[1, 3], metavar=("MIN", "MAX"), help="range of n-gram sizes (default: 1 3)")
+    parser.add_argument("--speakers", nargs="+", default=["MOD", "P1", "P2"], help="speakers (default: MOD P1 P2)")
+    parser.add_argument("--conversation", default="Conv_MOD_P1_P2", help="column of the conversation IDs (default: %(default)s)")
+    parser.add_argument("--model", default="en_core_web_sm", help="spaCy model (default: %(default)s)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="number of sentences spaCy annotates at once (default: %(default)s)")
+    parser.add_argument("--cache", default=None, help="SQLite file of annotated turns, as in BME_Repetitions.py (default: no cache)")
+    parser.add_argument("--minhash", type=int, default=None, metavar="K", help="sketches every turn by K min-hashes instead of computing the exact matrices (default: exact)")
+    parser.add_argument("--threshold", type=float, default=None, help="with --minhash, also saves the pairs of turns whose estimated Jaccard index is at least this (default: the min-hashes only)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the min-hashes (default: %(default)s)")
+    parser.add_argument("--report", default=None, help="JSON file reporting the time spent per stage (normalize, tag, matrix, write), as in BME_Repetitions.py (default: no report)")
+    args = parser.parse_args(argv)
+    if args.threshold is not None and not args.minhash:
+        parser.error("--threshold selects the pairs of turns from their min-hashes (needs --minhash)")
+
+    imports_sparse() # fails early without scipy
+    if args.report:
+        instruments.enabled = True
+        instruments.resets()
+    cache = AnnotationCache(args.cache, models_signature(args.model)) if args.cache else None
+    df = pd.read_csv(args.input)
+    annotated_turns = annotates_corpus(df, args.speakers, batch_size=args.batch_size, cache=cache, model_name=args.model)
+    results = turn_matrices(df, annotated_turns, range(args.ngrams[0], args.ngrams[1] + 1), args.speakers, args.conversation,
+                            minhash=args.minhash, seed=args.seed, threshold=args.threshold)
+    with instruments.stage("write"):
+        writes_matrices(args.output, results)
+    print(f"Matrices {args.output} have been created.")
+    if args.report:
+        instruments.writes(args.report, cache=cache.stats() if cache is not None else None)
+        print(f"Report {args.report} has been created.")
+    if cache is not None:
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
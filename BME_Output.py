@@ -0,0 +1,111 @@
+##Typed output##
+
+# Writes the output of BME_Repetitions.py as Parquet files (needs pyarrow) rather than a csv:
+# - the output dataframe, with typed columns: counts as int32, Jaccard indexes as float32, and missing values (non-B lines) as nulls rather than "".
+# - the repeated n-grams as a separate long-format table, one line per repeated n-gram, rather than lists of tuples in the cells:
+#   conversation, row, speaker, repetition (self/other), class (all/OC/CC), n, ngram (its words), pos (their POS).
+# The files are <output>.parquet and <output>_repetitions.parquet, whatever the extension of the output given (see parquet_paths()).
+
+#imports#
+import os # for the name of the repetition table
+import numpy as np # for the missing values
+import pandas as pd # for dataframes
+
+
+# metric_columns() returns the names of the columns of every metric, for all speakers, all classes and all n-gram sizes: {metric: [columns]}
+def metric_columns(speakers, ngram_sizes):
+    columns = {rep: [] for rep in ["repeated", "nonrepeated", "length", "jaccard_index", "repetition"]}
+    for ngram in ngram_sizes:
+        for ID in speakers:
+            for C in ["", "OC", "CC"]:
+                for p in ["self","other"]:
+                    for rep in columns:
+                        columns[rep].append(ID+"_"+C+"_"+p+"_"+rep+"_"+str(ngram)+"n")
+    return(columns)
+
+
+# parquet_paths() returns the paths of the two Parquet files of an output: <output>.parquet and <output>_repetitions.parquet
+# (e.g. output_example.parquet for output_example.csv, so a csv output is never overwritten by a Parquet file).
+def parquet_paths(path):
+    name = os.path.splitext(path)[0]
+    return(name + ".parquet", name + "_repetitions.parquet")
+
+
+# types_columns() returns the output dataframe with typed columns and without the "repetition" columns (see repetition_table()).
+# The input columns are kept, as text for the BME columns and the columns made of text, as numbers otherwise.
+def types_columns(df, speakers, ngram_sizes):
+    columns = metric_columns(speakers, ngram_sizes)
+    count_columns = set(columns["repeated"] + columns["nonrepeated"] + columns["length"])
+    jaccard_columns = set(columns["jaccard_index"])
+    repetition_columns = set(columns["repetition"])
+
+    typed = {}
+    for column in df.columns:
+        if column in repetition_columns:
+            continue
+        values = df[column]
+        if column in count_columns or column in jaccard_columns:
+            values = pd.to_numeric(values.mask(values.eq("")))
+            typed[column] = values.astype("Int32") if column in count_columns else values.astype(np.float32)
+        elif values.dtype == object or column.startswith(("Tag_Turn_", "BME_Turn_", "Conv_")):
+            typed[column] = values.astype("string") # also turns the mixed columns (e.g. 0 and "B_W") into text.
+        else:
+            typed[column] = values.astype(np.float64) # so every chunk of a streamed file has the same types.
+
+    return(pd.DataFrame(typed, index=df.index))
+
+
+# repetition_table() returns the repeated n-grams of every B_ line (see the BME method) as a long-format table.
+def repetition_table(df, speakers, ngram_sizes, conversation_column="Conv_MOD_P1_P2"):
+    rows = []
+    for ngram in ngram_sizes:
+        for ID in speakers:
+            for C in ["", "OC", "CC"]:
+                for p in ["self","other"]:
+                    column = df[ID+"_"+C+"_"+p+"_repetition_"+str(ngram)+"n"]
+                    for l, repetition in column[column.map(lambda value: isinstance(value, list) and len(value) > 0)].items():
+                        for item in repetition:
+                            rows.append((df[conversation_column][l], l, ID, p, C or "all", ngram,
+                                         " ".join(token[0] for token in item),
+                                         " ".join(token[1] for token in item)))
+
+    table = pd.DataFrame(rows, columns=["conversation", "row", "speaker", "repetition", "class", "n", "ngram", "pos"])
+    return(table.astype({"conversation": "string", "row": np.int64, "speaker": "string", "repetition": "string",
+                         "class": "string", "n": np.int32, "ngram": "string", "pos": "string"}))
+
+
+# ParquetOutput writes the output and its repetition table to two Parquet files ("<output>.parquet" and "<output>_repetitions.parquet").
+# writes() can be called several times (e.g. by streams_pipeline() in BME_Repetitions.py): every call adds a row group to both files.
+# Unlike the csv, a Parquet file is only readable once close() has been called.
+class ParquetOutput:
+
+    def __init__(self, path, speakers, ngram_sizes, conversation_column="Conv_MOD_P1_P2"):
+        try:
+            import pyarrow # for the Parquet files
+            import pyarrow.parquet
+        except(ImportError):
+            raise ImportError("the Parquet output needs pyarrow (pip install pyarrow)")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+
+        self.path, self.repetitions_path = parquet_paths(path)
+        self.speakers = speakers
+        self.ngram_sizes = ngram_sizes
+        self.conversation_column = conversation_column
+        self.writers = {}
+
+    def writes(self, df):
+        self.writes_table(self.path, types_columns(df, self.speakers, self.ngram_sizes))
+        self.writes_table(self.repetitions_path, repetition_table(df, self.speakers, self.ngram_sizes, self.conversation_column))
+
+    def writes_table(self, path, df):
+        table = self.pa.Table.from_pandas(df, preserve_index=path == self.path)
+        if path not in self.writers:
+            self.writers[path] = self.pq.ParquetWriter(path, table.schema)
+        else:
+            table = table.cast(self.writers[path].schema)
+        self.writers[path].write_table(table)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
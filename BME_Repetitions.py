@@ -13,6 +13,9 @@
 
 ## To test this code, a sample of the Multisimo Corpus (first 20 seconds of every conversation is provided) 
 
+# Usage: python BME_Repetitions.py --input input_example.csv --output output_example.csv (see main() for all the options),
+# or import it and call runs_pipeline() on a dataframe.
+
 # Requirements: 
 # Python 3.10.2
 # spaCy 3.7.2
@@ -22,46 +25,356 @@
 #### 
 
 #imports#
+import numpy as np # for the fill-forward of M and E lines
 import pandas as pd # for dataframes
-import spacy # for the POS tags
- 
-#load the small English model which has shown to be enough.
-nlp = spacy.load("en_core_web_sm")
-from spacy.tokens import Doc #to create a Doc object (personalised tokenizer)
+import argparse # for the command line
+import importlib.util # to find the package of the spaCy model
+import json # to read the meta.json of the spaCy model
+import functools # to give the same settings to every conversation processed in parallel
+import time # for the throughput of every conversation
+import os # to know whether the output already exists
+from collections import deque # for the history window of the register
+from concurrent.futures import ProcessPoolExecutor # to process several conversations at once
+from BME_Cache import AnnotationCache # to keep the annotated turns from one run to another
+from BME_Output import ParquetOutput, metric_columns, parquet_paths # to write the output as typed Parquet files
+from BME_Instruments import instruments # to measure where the time goes
+from BME_Index import NgramIndex # to index the n-grams of the turns
+from BME_Manifest import Manifest, splits_blocks, hashes_block, hashes_settings # to only recompute the conversations that changed
+# spaCy (for the POS tags) is only imported once a model is needed, see loads_model().
  
 
 #Functions#
 
-def my_tokenizer(string): # Specific Tokeniser so it reproduces older paper and deals with the specificities of our notations for spoken dialogue (as opposed to text).
+# The normalisation of the turns: lowercase, punctuation removed, and "!" and "?" turned into "." to split the sentences.
+# Brackets are removed, so BME annotations such as [laugh] or [eh] are kept as words (laugh, eh).
+NORMALISATION = str.maketrans(",'[]!?", "    ..")
 
-    #normalises the data:
-    string = string.lower()  #lowercase
-        
-    string = string.replace(".", " ").replace(",", " ").replace("!", " ").replace("?", " ").replace("'", " ").replace("[", " ").replace("]", " ") 
-    list_of_tokens = string.split() #parses
 
-    try :
-        list_of_tokens.remove(["[", "+", "]", ",", "(" , ")", ".", "?", "!", "...", "'", '"']) #removes punctuation
-    except(ValueError): 
-        print("no punctuation in turn:", list_of_tokens)
+def my_tokenizer(string): # Specific Tokeniser so it reproduces older paper and deals with the specificities of our notations for spoken dialogue (as opposed to text).
+
+    with instruments.stage("normalize"):
+        #normalises the data (lowercase, removes punctuation) and parses:
+        list_of_tokens = string.lower().translate(NORMALISATION).replace(".", " ").split()
 
-    doc = Doc(nlp.vocab, words=list_of_tokens) # makes it a DOC object, usable as Tokeniser for spaCy.
+        from spacy.tokens import Doc #to create a Doc object (personalised tokenizer)
+        doc = Doc(gets_model().vocab, words=list_of_tokens) # makes it a DOC object, usable as Tokeniser for spaCy.
     return doc
 
-nlp.tokenizer = my_tokenizer # Makes it the default tokeniser now.
+
+nlp = None # spaCy model used by all functions, loaded on first use (see gets_model()).
+
+# loads_model() makes a spaCy model the model used by all functions.
+# The model is either a name (loaded with spacy.load()) or an already loaded spaCy model, which is left as it is: the turns are
+# normalised and split in words beforehand (see normalises_turn()), and given to the model as Doc objects, so its tokeniser isn't used.
+def loads_model(model="en_core_web_sm"):
+    global nlp
+    if isinstance(model, str):
+        import spacy # for the POS tags
+        model = spacy.load(model)
+    nlp = model
+    return(nlp)
+
+
+# gets_model() returns the model used by all functions, and loads it if it hasn't been loaded yet.
+#load the small English model by default, which has shown to be enough.
+def gets_model(model_name=None):
+    if nlp is None:
+        loads_model(model_name or "en_core_web_sm")
+    return(nlp)
+
+
+# Our repetition system compares the last turns of a person to the present turns. The "register" keeps in memory the last turns of every speaker as sets of n-grams.
+# Every n-gram entering the register is interned to an integer ID, and its class (open "OC" or closed "CC") is computed once at that time.
+# The turns are then stored as sets of IDs, so repetitions are counted with set intersections rather than by scanning lists.
+# The history window is the last `window` turns of every speaker (1 by default, i.e. the last turn only; None for no limit),
+# and/or the turns that ended less than `seconds` seconds before the turn being counted (see advances()).
+# Every speaker's turns are kept in a ring buffer, and every n-gram is reference-counted (number of the speaker's turns it is in,
+# and number of speakers having it), so a turn entering or leaving the window only updates the available sets for its
+# own n-grams: the cost of a turn doesn't depend on the size of the window.
+# With the default window (the last turn only), a new turn simply replaces the last one, and the "other" content is the union
+# of the other speakers' last turns, as cheap to build as the reference counts are to update.
+class Register:
+
+    def __init__(self, window=1, seconds=None):
+        self.window = window # number of turns kept per speaker (None: no limit)
+        self.seconds = seconds # maximum age of the turns kept, in seconds (None: no limit)
+        self.ngram_ids = {} # n-gram -> integer ID
+        self.ngram_classes = [] # integer ID -> "OC" or "CC"
+        self.turns = {} # speaker's ID -> ring buffer of (set of IDs, end time) of the turns in the window
+        self.counts = {} # speaker's ID -> {n-gram ID: number of the speaker's turns in the window containing it}
+        self.speakers_having = {} # n-gram ID -> number of speakers having it in their window
+        self.items = {} # speaker's ID -> {"": set of IDs, "OC": set of IDs, "CC": set of IDs}
+        self.others = {} # speaker's ID -> {"": set of IDs, "OC": set of IDs, "CC": set of IDs} available from the other speakers
+        self.last_turn_only = window == 1 and seconds is None # no reference counts needed
+
+    def interns(self, ngram): # returns the integer ID of the n-gram, and classifies the n-gram if it has never been seen.
+        try:
+            return(self.ngram_ids[ngram])
+        except(KeyError):
+            isOpen = "CC" #tracks if the type, as a n-gram, is open class 
+            for subtype in ngram:
+                if subtype[2] == "open":
+                    isOpen = "OC"
+                if subtype[2] not in ["open", "closed"]:
+                    quit(("problem with subtype:", subtype, "subtype[2]:", subtype[2]))
+
+            self.ngram_ids[ngram] = len(self.ngram_classes)
+            self.ngram_classes.append(isOpen)
+            return(self.ngram_ids[ngram])
+
+    def joins(self, ID): # makes room for a new speaker, whose "other" content is what the other speakers already have.
+        if ID not in self.items:
+            self.turns[ID] = deque()
+            self.counts[ID] = {}
+            self.items[ID] = {"": set(), "OC": set(), "CC": set()}
+            others = set(self.speakers_having)
+            self.others[ID] = {"": others,
+                               "OC": {i for i in others if self.ngram_classes[i] == "OC"},
+                               "CC": {i for i in others if self.ngram_classes[i] == "CC"}}
+
+    def enters(self, ID, new_set, end=None): # adds a turn to the speaker's window, and drops the turns that fall out of it.
+        if self.last_turn_only:
+            self.items[ID] = {"": new_set,
+                              "OC": {i for i in new_set if self.ngram_classes[i] == "OC"},
+                              "CC": {i for i in new_set if self.ngram_classes[i] == "CC"}}
+            return
+        self.joins(ID)
+        self.turns[ID].append((new_set, end))
+        counts = self.counts[ID]
+        entering = new_set.difference(counts) # new in the speaker's window
+        for i in new_set:
+            counts[i] = counts.get(i, 0) + 1
+        leaving = set()
+        while self.window is not None and len(self.turns[ID]) > self.window:
+            leaving |= self.leaves(ID)
+        self.updates(ID, entering, leaving)
+
+    def leaves(self, ID): # drops the oldest turn of the speaker's window, and returns the IDs gone from it.
+        old_set, _ = self.turns[ID].popleft()
+        counts = self.counts[ID]
+        gone = set()
+        for i in old_set:
+            if counts[i] == 1:
+                del counts[i]
+                gone.add(i)
+            else:
+                counts[i] -= 1
+        return(gone)
+
+    def updates(self, ID, entering, leaving): # n-grams enter or leave a speaker's window: updates its self and others' sets.
+        if not entering and not leaving:
+            return
+        entering_OC = {i for i in entering if self.ngram_classes[i] == "OC"}
+        speakers_having = self.speakers_having
+        for i in entering:
+            speakers_having[i] = speakers_having.get(i, 0) + 1
+        for i in leaving:
+            if speakers_having[i] == 1:
+                del speakers_having[i]
+            else:
+                speakers_having[i] -= 1
+
+        def changes(sets, removed): # adds the entering n-grams to sets, and removes the removed ones.
+            sets[""] |= entering
+            sets["OC"] |= entering_OC
+            sets["CC"] |= entering - entering_OC
+            for C in ["", "OC", "CC"]:
+                sets[C] -= removed
+
+        changes(self.items[ID], leaving)
+        for participant in self.others:
+            if participant != ID: # an n-gram leaves participant's "other" content if no speaker but participant has it any more.
+                own = self.items[participant][""]
+                changes(self.others[participant], {i for i in leaving if speakers_having.get(i, 0) == (i in own)})
+
+    def advances(self, time): # with a window in seconds, drops the turns of all speakers which ended more than `seconds` before time (a speaker's turns end in order).
+        if self.seconds is None or time != time: # no time window, or no time (NaN)
+            return
+        for ID in self.turns:
+            leaving = set()
+            while self.turns[ID] and self.turns[ID][0][1] is not None and self.turns[ID][0][1] < time - self.seconds:
+                leaving |= self.leaves(ID)
+            self.updates(ID, set(), leaving)
+
+    def available(self, ID): # n-grams available for repetition, arranged by "self" (speaker's) or "other"'s content.
+        if self.last_turn_only:
+            set_items = {"self": {"": set(), "OC": set(), "CC": set()},
+                         "other": {"": set(), "OC": set(), "CC": set()}}
+            for participant in self.items:
+                p = "self" if ID == participant else "other"
+                for C in ["", "OC", "CC"]:
+                    set_items[p][C] |= self.items[participant][C]
+            return(set_items)
+
+        self.joins(ID)
+        return({"self": self.items[ID], "other": self.others[ID]})
 
 
-# Our repetition system compares the last turns of a person to the present turns. The "register" keeps in memory the last turn of every speaker as sets of tokens.
-# adds_to_register() adds a given turn to the register under the adequate speaker's ID.
-def adds_to_register(ID, list, register):
-    # should be ngrams
-    new_list = [tuple(item) for item in list] #from the list of paired POS and tokens, keeps the tokens and their given POS as tuples (because set(list) can't work if list is made of lists)
-    register[ID] = set(new_list)  # stores a set of the turn, so no word is repeated.
+# adds_to_register() adds a given turn (ending at `end` seconds, for a window in seconds) to the register under the adequate speaker's ID.
+def adds_to_register(ID, list, register, end=None):
+    with instruments.stage("register"):
+        # should be ngrams
+        new_set = {register.interns(tuple(item)) for item in list} #from the list of n-grams, keeps their IDs (a set, so no n-gram is repeated).
+        register.enters(ID, new_set, end)
     
     return(ID, register)
     
 
-def counts_rep(ID, string, register, ngram): # Function that counts the repetitions.
+# splits_sentences() splits a turn in sentences, as spaCy is given one sentence at a time.
+def splits_sentences(string):
+    return(string.replace("!", ".").replace("?", ".").split(".")) # splits all turns in sentences. 
+
+
+# annotates_sentence() rebuilds a sentence parsed by spaCy as a list of tokens, with their POS and "OPEN/CLOSE" class categories.
+def annotates_sentence(sent):
+    list_of_tokens = []
+
+    if sent.has_annotation('DEP'): #if has dependencies
+        #adds the tokens present in the sentence to the token list
+        for word in sent: #for every word
+            if word.text == "laugh": #all laughters: forced classification to INTJ
+                word.pos_ = "INTJ"
+            elif (word.text[:1] == "mh") or (word.text[:1] == "hm") or (word.text[:1] == "uhm"): #all hesitation: forced classification to INTJ
+                word.pos_ = "INTJ" 
+            word_category = "closed" # By default, the category of word is closed 
+            if word.pos_ in ["NOUN", "VERB", "ADJ", "ADV", "PROPN"]: #But "open" in these cases
+                word_category = "open"
+            
+            list_of_tokens.append((word.text, word.pos_, word_category)) #rebuilds the sentence as a list of token; 1 token = (word, pos, category)
+
+    return(list_of_tokens)
+
+
+# annotates_turn() tokenises a turn, adds POS to its tokens and their "OPEN/CLOSE" class categories.
+# This is done once per turn: the resulting sequence of tokens is then read by counts_rep() for every n-gram size.
+def annotates_turn(string):
+    list_of_tokens = []
+
+    from spacy.tokens import Doc # the sentences are split in words beforehand, so they are given to spaCy as Doc objects.
+    model = gets_model()
+    docs = [Doc(model.vocab, words=words) for words in normalises_turn(string)]
+    with instruments.stage("tag"):
+        for sent in model.pipe(docs): #for every sentence
+            list_of_tokens.extend(annotates_sentence(sent))
+
+    return(tuple(list_of_tokens)) # compact, immutable sequence of tokens shared by all n-gram sizes.
+
+
+# normalises_turn() normalises a single turn (see NORMALISATION) and splits it in sentences of words, as normalises_turns() does for a column.
+def normalises_turn(string):
+    with instruments.stage("normalize"):
+        return([sentence.split() for sentence in string.lower().translate(NORMALISATION).split(".")])
+
+
+# normalises_turns() normalises a whole column of turns at once (see NORMALISATION) and splits them in sentences of words,
+# as my_tokenizer() and splits_sentences() would, one turn at a time.
+# Returns the sentences as lists of words, one per line of the Series (the index of a turn is repeated for every sentence).
+def normalises_turns(turns):
+    with instruments.stage("normalize"):
+        sentences = turns.str.lower().str.translate(NORMALISATION).str.split(".", regex=False)
+        return(sentences.explode().str.split())
+
+
+# annotates_corpus() annotates every B_ turn of the dataframe (see the BME method), for all speakers and all conversations at once.
+# The turns are first normalised and split in sentences column by column (see normalises_turns()), then all sentences are
+# streamed through a single nlp.pipe() call, so spaCy can batch them (batch_size) and spread them over several processes (n_process).
+# With a cache (see BME_Cache.py), the turns already annotated in a previous run are read from it, and spaCy only annotates
+# (and is only loaded for) the new ones.
+# Returns the annotated turns arranged by speaker and line: {ID: {line: tokens}}
+def annotates_corpus(df, speakers, batch_size=1000, n_process=1, cache=None, model_name=None):
+    annotated_turns = {ID: {} for ID in speakers}
+
+    turns = {ID: df.loc[df["BME_Turn_"+ID].isin(["B_W","B_M"]), "Tag_Turn_"+ID].astype(str) for ID in speakers}
+
+    cached = {}
+    if cache is not None:
+        cached = cache.gets([string for ID in speakers for string in turns[ID]])
+
+    sentences = {} # sentences (lists of words) of the turns to annotate, for every speaker.
+    for ID in speakers:
+        is_cached = turns[ID].isin(cached.keys()) if cached else pd.Series(False, index=turns[ID].index)
+        for l, string in turns[ID][is_cached].items():
+            annotated_turns[ID][l] = cached[string]
+        for l in turns[ID].index[~is_cached]:
+            annotated_turns[ID][l] = [] # so turns without any sentence are still annotated (as empty).
+        sentences[ID] = normalises_turns(turns[ID][~is_cached])
+
+    if any(len(sentences[ID]) for ID in speakers): # only loads the model if there is something to annotate.
+        from spacy.tokens import Doc # the sentences are already split in words, so they are given to spaCy as Doc objects.
+        model = gets_model(model_name)
+        docs = ((Doc(model.vocab, words=words), (ID, l)) for ID in speakers for l, words in sentences[ID].items())
+        with instruments.stage("tag"):
+            for sent, (ID, l) in model.pipe(docs, as_tuples=True, batch_size=batch_size, n_process=n_process):
+                annotated_turns[ID][l].extend(annotates_sentence(sent))
+
+    new_turns = {}
+    for ID in speakers:
+        for l in sentences[ID].index.unique():
+            annotated_turns[ID][l] = tuple(annotated_turns[ID][l])
+            new_turns[turns[ID][l]] = annotated_turns[ID][l]
+
+    if cache is not None and new_turns:
+        cache.puts(new_turns)
+
+    return(annotated_turns)
+
+
+# reads_meta() returns the meta.json of a spaCy model that isn't loaded, from its directory or its installed package (None if there is none).
+def reads_meta(model_name):
+    path = model_name
+    if not os.path.isdir(path):
+        try:
+            spec = importlib.util.find_spec(model_name)
+        except(ImportError, ValueError): # e.g. a path that doesn't exist
+            spec = None
+        if spec is None or spec.origin is None:
+            return(None)
+        path = os.path.dirname(spec.origin)
+    if not os.path.isfile(os.path.join(path, "meta.json")):
+        return(None)
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as file:
+        return(json.load(file))
+
+
+# models_signature() returns the language, name and version of the spaCy model ("en_core_web_sm-3.7.1"), which the annotation cache is keyed with.
+# If the model isn't loaded yet, they are read from its meta.json, so a warm run doesn't need to load it; without one, the model is loaded.
+def models_signature(model_name="en_core_web_sm"):
+    meta = nlp.meta if nlp is not None else reads_meta(model_name)
+    if meta is None:
+        meta = gets_model(model_name).meta
+    return(f"{meta.get('lang', '')}_{meta.get('name', '')}-{meta.get('version', '')}")
+
+
+# splits_ngrams() divides an annotated turn in n-grams, listed for all ("") n-grams, Open Class (OC) and Close Class (CC) n-grams.
+# (As in the original code, an n-gram is listed under "CC" or "OC" once for each of its tokens, with the class known so far.)
+def splits_ngrams(list_of_tokens, ngram):
+    list_of_ngrams = {"": [],
+                      "OC" : [],
+                      "CC" : []
+                    }
+    
+    with instruments.stage("ngrams"):
+        # Divides the list into n-grams
+        for i in range(0,(len(list_of_tokens) - (ngram-1))): #for every n-gram
+            list_of_ngrams[""].append(tuple(list_of_tokens[i:i+ngram])) 
+            
+            # Checks whether the n-gram is open (if there is an element that is open, the ngram is open)
+            ngram_C = "CC" # the n-gram is by default closed
+
+            for token in (list_of_tokens[i:i+ngram]):
+                try:
+                    if token[2] == "open": #if one of the token is Open
+                        ngram_C = "OC" #n-gram is changed to "open"
+                        
+                except(IndexError):
+                    quit(f"problem with token: {token}")
+                
+                list_of_ngrams[ngram_C].append(tuple(list_of_tokens[i:i+ngram]))
+
+    return(list_of_ngrams)
+
+
+def counts_rep(ID, list_of_tokens, register, ngram): # Function that counts the repetitions, from a turn already annotated by annotates_turn().
     
     # initialises the counts of all ("") nature of tokens, Open class tokens (OC) and Close class tokens (CC)
     count_repeated = {"self" : {"repeated": {"": 0,
@@ -92,100 +405,38 @@ def counts_rep(ID, string, register, ngram): # Function that counts the repetiti
                         }
                     }
 
-    
-    #Tokenises and adds POS to the turns, and "OPEN/CLOSE" class categories
-    sentences = string.replace("!", ".").replace("?", ".").split(".") # splits all turns in sentences. 
-    list_of_tokens = []
-
-    for i, sent in enumerate(nlp.pipe(sentences)): #for every sentence
-        if sent.has_annotation('DEP'): #if has dependencies
-            #adds the tokens present in the sentence to the token list
-            for word in sent: #for every word
-                if word.text == "laugh": #all laughters: forced classification to INTJ
-                    word.pos_ = "INTJ"
-                elif (word.text[:1] == "mh") or (word.text[:1] == "hm") or (word.text[:1] == "uhm"): #all hesitation: forced classification to INTJ
-                    word.pos_ = "INTJ" 
-                word_category = "closed" # By default, the category of word is closed 
-                if word.pos_ in ["NOUN", "VERB", "ADJ", "ADV", "PROPN"]: #But "open" in these cases
-                    word_category = "open"
-                
-                list_of_tokens.append((word.text, word.pos_, word_category)) #rebuilds the sentence as a list of token; 1 token = (word, pos, category)
-
     # list of tokens is parsed into n-grams that belong to different categories (all, Open Class, Close Class):
-    list_of_ngrams = {"": [],
-                      "OC" : [],
-                      "CC" : []
-                    }
-    
-    # Divides the list into n-grams
-    for i in range(0,(len(list_of_tokens) - (ngram-1))): #for every n-gram
-        list_of_ngrams[""].append(tuple(list_of_tokens[i:i+ngram])) 
-        
-        # Checks whether the n-gram is open (if there is an element that is open, the ngram is open)
-        ngram_C = "CC" # the n-gram is by default closed
-
-        for token in (list_of_tokens[i:i+ngram]):
-            try:
-                if token[2] == "open": #if one of the token is Open
-                    ngram_C = "OC" #n-gram is changed to "open"
-                    
-            except(IndexError):
-                quit(f"problem with token: {token}")
-            
-            list_of_ngrams[ngram_C].append(tuple(list_of_tokens[i:i+ngram]))
-
+    list_of_ngrams = splits_ngrams(list_of_tokens, ngram)
 
     #count repetitions#
-    #set items from the register available for repetition: 
-            #in the register are arranged by players. Now need to be arranged by "self" (speaker's) or "other"'s content
-    set_items = {"other": {"" : [],
-                           "OC" : [],
-                           "CC": []},
-                "self": {"" : [],
-                           "OC" : [],
-                           "CC": []} 
-                }
-   
-    for participant in register:
-        
-        for type in set(register[participant]): 
-
-            isOpen = "CC" #tracks if the type, as a n-gram, is open class 
-            for subtype in type:
-                if subtype[2] == "open":
-                    isOpen = "OC"
-                if subtype[2] not in ["open", "closed"]:
-                    quit(("problem with subtype:", subtype, "subtype[2]:", subtype[2]))
-                
-            if ID == participant: #if ID of the speaker is the same as the register's participant's, then adds self repetitions
-
-                set_items["self"][""].append(type) #adds to the "all" main category
-                set_items["self"][isOpen].append(type) #adds to either the "CC" or "OC" category, based on previous for-loop.
-                
-            else :  #if the register's participant is not the speaker:
-                set_items["other"][""].append(type)
-                set_items["other"][isOpen].append(type)
+    with instruments.stage("register"):
+        #set items from the register available for repetition (IDs), arranged by "self" (speaker's) or "other"'s content:
+        set_items = register.available(ID)
 
-    for C in ["", "OC", "CC"] :  #For three categories: all, OC, CC
-        for p in ["self", "other"]: # for the self and other repetitions
+        for C in ["", "OC", "CC"] :  #For three categories: all, OC, CC
+            ngram_ids = [register.interns(ngram) for ngram in list_of_ngrams[C]] # IDs of the n-grams in turn.
 
-            # counts the repetitions 
-            for ngram in list_of_ngrams[C]: # for n-gram in turn.
+            for p in ["self", "other"]: # for the self and other repetitions
 
-                if ngram in set_items[p][C]: # if n-gram is present in the register for self/other, all/OC/CC
-                    count_repeated[p]["repeated"][C] += 1 # count of repetition incremented
-                    count_repeated[p]["repetition"][C].append(ngram) # keeping track of what has counted as a repetition
+                # counts the repetitions 
+                repeated_ids = set() 
+                for ngram, i in zip(list_of_ngrams[C], ngram_ids): # for n-gram in turn.
+                    if i in set_items[p][C]: # if n-gram is present in the register for self/other, all/OC/CC
+                        count_repeated[p]["repeated"][C] += 1 # count of repetition incremented
+                        count_repeated[p]["repetition"][C].append(ngram) # keeping track of what has counted as a repetition
+                        repeated_ids.add(i)
 
-            # keeps track of the words from the register which could have been repeated but were not.
-            for type in set(set_items[p][C]):
-                if type not in count_repeated[p]["repetition"][C]: 
-                        count_repeated[p]["nonrepeated"][C] += 1
+                # keeps track of the n-grams from the register which could have been repeated but were not.
+                count_repeated[p]["nonrepeated"][C] = len(set_items[p][C]) - len(repeated_ids)
                 
-            # calculates the jaccard index
-            try: 
-                count_repeated[p]["jaccard_index"][C] = count_repeated[p]["repeated"][C] / (len(set(set_items[p][C])) + len(list_of_ngrams[C]) - count_repeated[p]["repeated"][C])
-            except(ZeroDivisionError): #if there is a turn but no n-gram for n > 1
-                count_repeated[p]["jaccard_index"][C] = 0
+    with instruments.stage("jaccard"):
+        for C in ["", "OC", "CC"] :
+            for p in ["self", "other"]:
+                # calculates the jaccard index
+                try: 
+                    count_repeated[p]["jaccard_index"][C] = count_repeated[p]["repeated"][C] / (len(set_items[p][C]) + len(list_of_ngrams[C]) - count_repeated[p]["repeated"][C])
+                except(ZeroDivisionError): #if there is a turn but no n-gram for n > 1
+                    count_repeated[p]["jaccard_index"][C] = 0
 
     return(list_of_ngrams, count_repeated)
 
@@ -197,274 +448,399 @@ def counts_rep(ID, string, register, ngram): # Function that counts the repetiti
 
 
 
-####
-#open files#
-
-#input file
-df = pd.read_csv("input_example.csv")
-
-for ngram in range (1,4): #loop add different n-gram sized repetitions
- 
-    #initialise a dictionary containing all data for every line, before being put into a dataframe to save it.
-    dict_final = {"MOD":  {"self" : {"repeated": {"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "nonrepeated": {"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "jaccard_index": {"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "length":{"": [],
-                                                  "OC" : [],
-                                                    "CC" : []},
-                                        "repetition": { "": [],
-                                                  "OC" : [],
-                                                    "CC" : []}},
-                            "other" : {"repeated": {"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "nonrepeated": {"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "jaccard_index": {"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "length":{"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "repetition": { "": [],
-                                                  "OC" : [],
-                                                    "CC" : []}}} ,
-
-                    "P1":  {"self" : {"repeated": {"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "nonrepeated": {"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "jaccard_index": {"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "length":{"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "repetition": { "": [],
-                                                  "OC" : [],
-                                                    "CC" : []}},
-                            "other" : {"repeated": {"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "nonrepeated": {"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "jaccard_index": {"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "length":{"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "repetition": { "": [],
-                                                  "OC" : [],
-                                                    "CC" : []}}},
-
-                    "P2":  {"self" : {"repeated": {"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "nonrepeated": {"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "jaccard_index": {"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "length":{"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "repetition": { "": [],
-                                                  "OC" : [],
-                                                    "CC" : []}},
-                            "other" : {"repeated": {"": [],
-                                            "OC" : [],
-                                            "CC" : []},
-                                        "nonrepeated": {"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "jaccard_index": {"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "length":{"": [],
-                                                    "OC" : [],
-                                                    "CC" : []},
-                                        "repetition": { "": [],
-                                                  "OC" : [],
-                                                    "CC" : []}}}
-                    }
-    
-    
-    
-       
-    conversation = "" # nature of the conversation (we span through 18 conversations, so this is important to check the boundaries and
-                     # reinitialise it on time.)
-   
-
-    
-
-    for l in df.index: # for every line/turn.
-
-        # dict_turn_counts to keep track of the information required on one line (before being added to dict_final once we've processed it all)
-        dict_turn_counts = {"MOD":  {"self" : {"repeated": {"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "nonrepeated": {"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "jaccard_index": {"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "length":{"": "",
-                                                  "OC" : "",
-                                                    "CC" : ""},
-                                        "repetition":{"": "",
-                                                  "OC" : "",
-                                                    "CC" : ""}},
-                            "other" : {"repeated": {"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "nonrepeated": {"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "jaccard_index": {"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "length":{"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "repetition":{"": "",
-                                                  "OC" : "",
-                                                    "CC" : ""}}} ,
-
-                    "P1":  {"self" : {"repeated": {"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "nonrepeated": {"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "jaccard_index": {"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "length":{"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "repetition": { "": "",
-                                                  "OC" : "",
-                                                    "CC" : ""}},
-                            "other" : {"repeated": {"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "nonrepeated": {"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "jaccard_index": {"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "length":{"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "repetition": { "": "",
-                                                  "OC" : "",
-                                                    "CC" : ""}}},
-
-                    "P2":  {"self" : {"repeated": {"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "nonrepeated": {"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "jaccard_index": {"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "length":{"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "repetition":{"": "",
-                                                  "OC" : "",
-                                                    "CC" : ""}},
-                            "other" : {"repeated": {"": "",
-                                            "OC" : "",
-                                            "CC" : ""},
-                                        "nonrepeated": {"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "jaccard_index": {"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "length":{"": "",
-                                                    "OC" : "",
-                                                    "CC" : ""},
-                                        "repetition":{"": "",
-                                                  "OC" : "",
-                                                    "CC" : ""}}}
-                    }
-
-        if (df["Conv_MOD_P1_P2"][l] != conversation): #if new conversation, reinitialises the register, so there is no overlap of repetition.
-            register = {    
-                        "player1": [],
-                        "player2": [],
-                        "MOD": []
-                    }    
-            conversation = df["Conv_MOD_P1_P2"][l] #takes the new conversation_ID
-
-        turns_to_add = {} #turns to add to the register.
-   
-        for ID in ["MOD", "P1", "P2"]:
-            list_of_ngrams = {"":[],
-                              "OC":[],
-                              "CC":[]}
-
-            if df["BME_Turn_"+ID][l] in ["B_W","B_M"]: # if is a b_turn (i.e. see the BME method), then it means there is a new turn to look into
-                string =  str(df["Tag_Turn_"+ID][l])
-                list_of_ngrams, dict_turn_counts[ID] = counts_rep(ID, string, register, ngram)
-                turns_to_add[ID] = list_of_ngrams[""] #keeps track of the speaker's ID, and their turn.
-
-            #adds necessary turns to the register without changing if a player hasn't uttered anything since last time.
-            for participant in turns_to_add:
-                string =  turns_to_add[participant]
-                adds_to_register(participant, string, register) 
-
-            # transfers to "dict_final" all the information collected and calculated on this line.
-            for p in ["self","other"]:
-                for C in ["", "OC", "CC"]:
-                    for rep in ["repeated", "nonrepeated"]:
-                        dict_final[ID][p][rep][C].append(dict_turn_counts[ID][p][rep][C])
-                    dict_final[ID][p]["length"][C].append(len(list_of_ngrams[C]))
-                    dict_final[ID][p]["jaccard_index"][C].append(dict_turn_counts[ID][p]["jaccard_index"][C])
-                    dict_final[ID][p]["repetition"][C].append(dict_turn_counts[ID][p]["repetition"][C])
-
-
-    # put in the DataFrame    
-    for ID in ["MOD", "P1", "P2"]:
-        for C in ["", "OC", "CC"]:
-            for p in ["self","other"]:
-                for rep in ["repeated", "nonrepeated", "length", "jaccard_index", "repetition"]:
-                    df[ID+"_"+C+"_"+p+"_"+rep+"_"+str(ngram)+"n"] = dict_final[ID][p][rep][C]
-                    
-
-                    
-
-#SaveFile :
-
-## Feels up M and E lines based on the B_lines (see the BME method).  
-for ngram in range(1,4):
-    for ID in ["MOD", "P1", "P2"]:
-        for p in ["self","other"]:
-            for rep in ["repeated", "nonrepeated", "length", "jaccard_index"]:
-                for C in ["", "OC", "CC"]:
-                    for line in df.index:
-                        if line != 0: #if line isn't the first one (M and E lines can't be first.)
-                            if df['BME_Turn_' + ID][line] in ["M", "E_M", "E_W"]:
-                                df[ID+"_"+C+"_"+p+"_"+rep+"_"+str(ngram)+"n"][line] = df[ID+"_"+C+"_"+p+"_"+rep+"_"+str(ngram)+"n"][line-1]
-
-name_output = "output_example.csv"
-
-df.to_csv(name_output)
-print(f"Output {name_output} has been created.")
+# fills_lines() fills up M and E lines based on the B_lines (see the BME method): an M or E line takes the values of the line before it.
+# For every speaker, it is done at once over the whole block of that speaker's columns: each line is mapped to the last line
+# that is neither M nor E (the first line is never filled), and the block is re-indexed with it.
+# Returns a new dataframe (built at once, as setting hundreds of columns one by one in pandas copies the data every time).
+def fills_lines(df, speakers, ngram_sizes):
+    filled = {}
+    for ID in speakers:
+        columns = [ID+"_"+C+"_"+p+"_"+rep+"_"+str(ngram)+"n" for ngram in ngram_sizes
+                                                               for C in ["", "OC", "CC"]
+                                                               for p in ["self","other"]
+                                                               for rep in ["repeated", "nonrepeated", "length", "jaccard_index"]]
+
+        to_fill = df['BME_Turn_' + ID].isin(["M", "E_M", "E_W"]).to_numpy(copy=True)
+        to_fill[:1] = False #if line is the first one, it isn't filled (M and E lines can't be first.)
+
+        lines = np.arange(len(df))
+        source_lines = np.maximum.accumulate(np.where(to_fill, 0, lines)) # line each line takes its values from.
+
+        for column in columns:
+            filled[column] = df[column].to_numpy()[source_lines]
+
+    return(pd.DataFrame({column: filled[column] if column in filled else df[column] for column in df.columns}, index=df.index))
+
+
+# counts_repetitions() counts the repetitions of every B_ turn of the dataframe (see the BME method), from its annotated turns.
+# The register is reinitialised whenever the conversation changes, so the dataframe can hold one or several conversations.
+# The results are kept in preallocated arrays, indexed by (line, speaker, self/other, class, metric, n-gram size), and
+# only turned into columns at the end: "" for the lines without a B_ turn (except for the length, 0), as in the original output.
+# The register keeps the last `window` turns of every speaker, and/or the turns of the last `seconds` seconds (see Register),
+# using the STT_Turn_ and ETT_Turn_ columns (start and end times of the turns).
+# With an index (see BME_Index.py), the n-grams of every B_ turn are also indexed, with their line, speaker and start time.
+# Returns the new columns as a dataframe with the same index as df.
+def counts_repetitions(df, annotated_turns, ngram_sizes, speakers=("MOD", "P1", "P2"), conversation_column="Conv_MOD_P1_P2", window=1, seconds=None, index=None):
+    ngram_sizes = list(ngram_sizes)
+    participants = ["self", "other"]
+    classes = ["", "OC", "CC"]
+    metrics = ["repeated", "nonrepeated", "length", "jaccard_index"]
+
+    values = np.zeros((len(df), len(speakers), len(participants), len(classes), len(metrics), len(ngram_sizes))) # all numbers
+    repetitions = np.full((len(df), len(speakers), len(participants), len(classes), len(ngram_sizes)), "", dtype=object) # repeated n-grams
+    is_turn = np.zeros((len(df), len(speakers)), dtype=bool) # lines where a speaker starts a turn (B_ lines)
+
+    conversations = df[conversation_column].to_numpy()
+    bme_turns = {ID: df["BME_Turn_"+ID].to_numpy() for ID in speakers}
+    lines = df.index
+    if seconds is not None: # start and end times of the turns, for the window in seconds.
+        starts = {ID: pd.to_numeric(df["STT_Turn_"+ID], errors="coerce").to_numpy() for ID in speakers}
+        ends = {ID: pd.to_numeric(df["ETT_Turn_"+ID], errors="coerce").to_numpy() for ID in speakers}
+    elif index is not None: # start times of the turns, if any, for the index.
+        starts = {ID: pd.to_numeric(df["STT_Turn_"+ID], errors="coerce").to_numpy() if "STT_Turn_"+ID in df else np.full(len(df), np.nan) for ID in speakers}
+
+    for n, ngram in enumerate(ngram_sizes): #loop add different n-gram sized repetitions
+
+        conversation = "" # nature of the conversation (we span through 18 conversations, so this is important to check the boundaries and
+                         # reinitialise it on time.)
+        started, turns = time.perf_counter(), 0 # for the throughput of every conversation (turns are only counted once, for the first n-gram size)
+
+        for i in range(len(df)): # for every line/turn.
+
+            if (conversations[i] != conversation): #if new conversation, reinitialises the register, so there is no overlap of repetition.
+                if i > 0:
+                    instruments.records_conversation(conversation, turns, time.perf_counter() - started)
+                started, turns = time.perf_counter(), 0
+                register = Register(window, seconds)
+                conversation = conversations[i] #takes the new conversation_ID
+
+            for s, ID in enumerate(speakers):
+
+                if bme_turns[ID][i] in ["B_W","B_M"]: # if is a b_turn (i.e. see the BME method), then it means there is a new turn to look into
+                    if seconds is not None: # drops the turns which ended too long before this one.
+                        register.advances(starts[ID][i])
+                    list_of_ngrams, count_repeated = counts_rep(ID, annotated_turns[ID][lines[i]], register, ngram)
+
+                    #adds the turn to the register, so it can be repeated by the next turns (including the other speakers' on this line).
+                    adds_to_register(ID, list_of_ngrams[""], register, ends[ID][i] if seconds is not None else None)
+                    if index is not None:
+                        index.adds(conversation, lines[i], ID, starts[ID][i], list_of_ngrams[""])
+
+                    # transfers to the arrays all the information collected and calculated on this line.
+                    is_turn[i, s] = True
+                    turns += (n == 0)
+                    for x, p in enumerate(participants):
+                        for c, C in enumerate(classes):
+                            jaccard_index = count_repeated[p]["jaccard_index"][C]
+                            values[i, s, x, c, :, n] = (count_repeated[p]["repeated"][C],
+                                                        count_repeated[p]["nonrepeated"][C],
+                                                        len(list_of_ngrams[C]),
+                                                        jaccard_index if isinstance(jaccard_index, float) else np.nan) # NaN if no n-gram at all (written 0).
+                            repetitions[i, s, x, c, n] = count_repeated[p]["repetition"][C]
+
+        if len(df) > 0:
+            instruments.records_conversation(conversation, turns, time.perf_counter() - started)
+
+    # put in the results    
+    results = {}
+    for n, ngram in enumerate(ngram_sizes):
+        for s, ID in enumerate(speakers):
+            for c, C in enumerate(classes):
+                for x, p in enumerate(participants):
+                    for m, rep in enumerate(metrics):
+                        column = values[:, s, x, c, m, n]
+                        if rep == "length":
+                            results[ID+"_"+C+"_"+p+"_"+rep+"_"+str(ngram)+"n"] = column.astype(np.int64)
+                            continue
+                        cells = np.full(len(df), "", dtype=object)
+                        if rep == "jaccard_index":
+                            cells[is_turn[:, s]] = [0 if np.isnan(value) else value for value in column[is_turn[:, s]]]
+                        else:
+                            cells[is_turn[:, s]] = column[is_turn[:, s]].astype(np.int64)
+                        results[ID+"_"+C+"_"+p+"_"+rep+"_"+str(ngram)+"n"] = cells
+                    results[ID+"_"+C+"_"+p+"_repetition_"+str(ngram)+"n"] = repetitions[:, s, x, c, n]
+
+    return(pd.DataFrame(results, index=df.index))
+
+
+# processes_conversation() annotates and counts the repetitions of a single conversation (run by the workers of runs_pipeline()).
+# Returns the new columns, and the hits and misses of the worker's annotation cache and its instruments' report for this conversation.
+# With indexed=True, it also returns the index of the n-grams of the conversation (see BME_Index.py).
+def processes_conversation(df, ngram_sizes, speakers=("MOD", "P1", "P2"), batch_size=1000, model_name=None, conversation_column="Conv_MOD_P1_P2", window=1, seconds=None, indexed=False):
+    hits, misses = (worker_cache.hits, worker_cache.misses) if worker_cache is not None else (0, 0)
+    instruments.resets()
+
+    annotated_turns = annotates_corpus(df, speakers, batch_size=batch_size, cache=worker_cache, model_name=model_name)
+    index = NgramIndex() if indexed else None
+    results = counts_repetitions(df, annotated_turns, ngram_sizes, speakers, conversation_column, window, seconds, index)
+
+    if worker_cache is not None:
+        hits, misses = worker_cache.hits - hits, worker_cache.misses - misses
+    return(results, {"hits": hits, "misses": misses, "instruments": instruments.report() if instruments.enabled else None, "index": index})
+
+
+worker_cache = None # annotation cache of a worker process (see initialises_worker()).
+
+# initialises_worker() prepares every worker process: it opens its own connection to the annotation cache, if any,
+# and turns its instruments on if the run is instrumented.
+# The spaCy model is loaded once per worker, on first use (i.e. not at all if every turn is already in the cache).
+def initialises_worker(cache_settings=None, instrumented=False):
+    global worker_cache
+    if cache_settings is not None:
+        worker_cache = AnnotationCache(*cache_settings)
+    instruments.enabled = instrumented
+
+
+# creates_executor() creates the pool of worker processes used to process conversations in parallel.
+def creates_executor(workers, cache=None):
+    cache_settings = (cache.path, cache.model_signature, cache.max_entries) if cache is not None else None
+    return(ProcessPoolExecutor(max_workers=workers, initializer=initialises_worker, initargs=(cache_settings, instruments.enabled)))
+
+
+# runs_pipeline() computes all the repetition columns of the dataframe and fills up its M and E lines.
+# Conversations are independent (the register is reinitialised for each of them), so with workers > 1 the dataframe is split
+# by conversation and the conversations are processed in parallel; the results are put back in the original order of the lines.
+# An executor can be given to reuse the same worker processes over several calls (see streams_pipeline()).
+# previous_line is the last line already processed before df, if any, which the M and E lines at the start of df are filled from.
+# cache is an AnnotationCache (see BME_Cache.py), which also gathers the hits and misses of the workers.
+# window and seconds set the history window of the register (see Register).
+# index is an NgramIndex (see BME_Index.py), to which the n-grams of the turns are added, if any.
+def runs_pipeline(df, ngram_sizes, speakers=("MOD", "P1", "P2"), workers=1, batch_size=1000, n_process=1, model_name="en_core_web_sm", executor=None, previous_line=None, cache=None, conversation_column="Conv_MOD_P1_P2", window=1, seconds=None, index=None):
+    if workers > 1 or executor is not None:
+        conversations = (df[conversation_column] != df[conversation_column].shift()).cumsum() # a new number every time the conversation changes.
+        blocks = [block for _, block in df.groupby(conversations, sort=False)]
+        processes = functools.partial(processes_conversation, ngram_sizes=ngram_sizes, speakers=speakers, batch_size=batch_size,
+                                      model_name=model_name, conversation_column=conversation_column, window=window, seconds=seconds,
+                                      indexed=index is not None)
+
+        if executor is None:
+            with creates_executor(workers, cache) as executor:
+                outputs = list(executor.map(processes, blocks))
+        else:
+            outputs = list(executor.map(processes, blocks))
+
+        results = pd.concat([output[0] for output in outputs])
+        if cache is not None:
+            cache.hits += sum(output[1]["hits"] for output in outputs)
+            cache.misses += sum(output[1]["misses"] for output in outputs)
+        for output in outputs:
+            if output[1]["instruments"] is not None:
+                instruments.merges(output[1]["instruments"])
+            if index is not None:
+                index.merges(output[1]["index"])
+
+    else:
+        # Annotates every B_ turn once (see the BME method), before any n-gram is built.
+        # The annotated turns are then shared by all n-gram sizes, so spaCy only runs once per turn.
+        annotated_turns = annotates_corpus(df, speakers, batch_size=batch_size, n_process=n_process, cache=cache, model_name=model_name)
+        results = counts_repetitions(df, annotated_turns, ngram_sizes, speakers, conversation_column, window, seconds, index)
+
+    df = pd.concat([df, results], axis=1)
+
+    ## Feels up M and E lines based on the B_lines (see the BME method).  
+    with instruments.stage("fill"):
+        if previous_line is not None:
+            return(fills_lines(pd.concat([previous_line, df]), speakers, ngram_sizes).iloc[1:])
+        return(fills_lines(df, speakers, ngram_sizes))
+
+
+# streams_pipeline() runs the pipeline on a csv file too large to be held in memory.
+# The input is read by chunks of lines; the lines are processed once their conversation is complete (i.e. once the next
+# conversation has started), and appended to the output file straight away. The memory used is then bounded by the
+# largest conversation, and an interrupted run leaves an output made of complete conversations.
+# With output_format="parquet", every group of conversations is written as a row group of the Parquet files (see BME_Output.py).
+# Returns the path of the output (of its main Parquet file, see parquet_paths()).
+def streams_pipeline(name_input, name_output, ngram_sizes, speakers=("MOD", "P1", "P2"), chunksize=10000, workers=1, batch_size=1000, n_process=1, model_name="en_core_web_sm", cache=None, output_format="csv", conversation_column="Conv_MOD_P1_P2", window=1, seconds=None, index=None):
+    pending = None # lines of the last conversation read, which might continue in the next chunk.
+    previous_line = None # last line written to the output.
+    executor = None
+    if workers > 1:
+        executor = creates_executor(workers, cache)
+    parquet_output = None
+    if output_format == "parquet":
+        parquet_output = ParquetOutput(name_output, speakers, ngram_sizes, conversation_column)
+
+    def writes(df, previous_line): # processes complete conversations and appends them to the output.
+        df = runs_pipeline(df, ngram_sizes, speakers, batch_size=batch_size, n_process=n_process, model_name=model_name,
+                           executor=executor, previous_line=previous_line, cache=cache, conversation_column=conversation_column,
+                           window=window, seconds=seconds, index=index)
+        with instruments.stage("write"):
+            if parquet_output is not None:
+                parquet_output.writes(df)
+            else:
+                df.to_csv(name_output, mode="w" if previous_line is None else "a", header=previous_line is None)
+        return(df.iloc[-1:])
+
+    try:
+        for chunk in pd.read_csv(name_input, chunksize=chunksize):
+            if pending is not None:
+                chunk = pd.concat([pending, chunk])
+
+            new_conversation = (chunk[conversation_column] != chunk[conversation_column].shift()).to_numpy()
+            last_start = np.flatnonzero(new_conversation)[-1] # first line of the last conversation of the chunk.
+
+            pending = chunk.iloc[last_start:]
+            if last_start > 0:
+                previous_line = writes(chunk.iloc[:last_start], previous_line)
+
+        if pending is not None:
+            previous_line = writes(pending, previous_line)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if parquet_output is not None:
+            parquet_output.close()
+
+    return(parquet_output.path if parquet_output is not None else name_output)
+
+
+# runs_incremental() runs the pipeline on a csv file whose output was already computed, and only recomputes the conversations
+# that changed since (see BME_Manifest.py): the other conversations are copied from the existing output, without spaCy.
+# The manifest records the conversations of the output (by default <output>.manifest.json); without it, or if the settings
+# changed, everything is recomputed. A conversation starting with an M or E line is filled from the line before it (see fills_lines()),
+# so it is recomputed too if the conversation before it changed. Consecutive recomputed conversations are processed together by
+# runs_pipeline(), given the line of the output before them, as in streams_pipeline().
+# Returns the new dataframe, and the number of conversations recomputed and in all.
+def runs_incremental(name_input, name_output, ngram_sizes, speakers=("MOD", "P1", "P2"), workers=1, batch_size=1000, n_process=1, model_name="en_core_web_sm", cache=None, conversation_column="Conv_MOD_P1_P2", window=1, seconds=None, manifest_path=None):
+    manifest = Manifest(manifest_path or name_output + ".manifest.json")
+    df = pd.read_csv(name_input)
+
+    # the columns the repetitions are computed from, and the settings they are computed with.
+    columns = [conversation_column] + [column+ID for ID in speakers for column in ["Tag_Turn_", "BME_Turn_"] + (["STT_Turn_", "ETT_Turn_"] if seconds is not None else [])]
+    blocks = splits_blocks(df, conversation_column)
+    hashes = {key: hashes_block(df.iloc[start:stop][columns]) for key, (start, stop) in blocks.items()}
+    settings = hashes_settings(ngram_sizes=list(ngram_sizes), speakers=list(speakers), conversation_column=conversation_column,
+                               window=window, seconds=seconds, model=models_signature(model_name))
+    changed = manifest.changes(settings, hashes, name_output)
+    # a conversation starting with a line filled from the line before it is recomputed if the conversation before it changed.
+    continued = df[["BME_Turn_"+ID for ID in speakers]].isin(["M", "E_M", "E_W"]).any(axis=1).to_numpy()
+    old_before = {old["stop"]: key for key, old in manifest.conversations.items()} # conversation before each one in the existing output.
+    keys = list(blocks)
+    for k, key in enumerate(keys):
+        before = keys[k-1] if k > 0 else None
+        if key not in changed and continued[blocks[key][0]] and (before in changed or old_before.get(manifest.conversations[key]["start"]) != before):
+            changed.add(key)
+
+    previous = None
+    if len(changed) < len(blocks): # the output is read as text, so the copied lines are written back exactly as they were.
+        previous = pd.read_csv(name_output, index_col=0, dtype=str, keep_default_na=False)
+    executor = creates_executor(workers, cache) if workers > 1 and changed else None
+    metrics = {column for columns in metric_columns(speakers, ngram_sizes).values() for column in columns} # the columns computed from the input
+
+    results = [] # new columns of every conversation, or of every group of consecutive recomputed conversations.
+    previous_line = None # last line of the new output so far.
+    try:
+        for k, key in enumerate(keys):
+            start, stop = blocks[key]
+            if key not in changed:
+                old = manifest.conversations[key]
+                results.append(previous.iloc[old["start"]:old["stop"]][[column for column in previous.columns if column in metrics]].set_axis(df.index[start:stop]))
+                previous_line = pd.concat([df.iloc[stop-1:stop], results[-1].iloc[-1:]], axis=1)
+            elif k == 0 or keys[k-1] not in changed: # first of a group of recomputed conversations.
+                group_stop = next((blocks[other][0] for other in keys[k:] if other not in changed), len(df))
+                recomputed = runs_pipeline(df.iloc[start:group_stop], ngram_sizes, speakers, batch_size=batch_size, n_process=n_process,
+                                           model_name=model_name, executor=executor, previous_line=previous_line, cache=cache,
+                                           conversation_column=conversation_column, window=window, seconds=seconds)
+                results.append(recomputed[[column for column in recomputed.columns if column in metrics]])
+                previous_line = recomputed.iloc[-1:]
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    df = pd.concat([df] + ([pd.concat(results)] if results else []), axis=1)
+
+    manifest.invalidates() # so an interrupted write doesn't leave a manifest describing another output.
+    with instruments.stage("write"):
+        df.to_csv(name_output)
+    manifest.writes(settings, hashes, blocks, name_output)
+    return(df, {"recomputed": len(changed), "conversations": len(blocks)})
+
+
+# main() runs the whole pipeline from the command line, e.g.:
+#   python BME_Repetitions.py --input input_example.csv --output output_example.csv --ngrams 1 3 --speakers MOD P1 P2
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calculates repetition for a conversation file structured with the BME method.")
+    parser.add_argument("-i", "--input", default="input_example.csv", help="input csv file (default: %(default)s)")
+    parser.add_argument("-o", "--output", default="output_example.csv", help="output file (default: %(default)s)")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv",
+                        help="csv, or typed Parquet files with the repeated n-grams in a separate <output>_repetitions.parquet table (default: %(default)s)")
+    parser.add_argument("--ngrams", nargs=2, type=int, default=[1, 3], metavar=("MIN", "MAX"), help="range of n-gram sizes (default: 1 3)")
+    parser.add_argument("--speakers", nargs="+", default=["MOD", "P1", "P2"], help="speakers, as in the Tag_Turn_<speaker> and BME_Turn_<speaker> columns (default: MOD P1 P2)")
+    parser.add_argument("--conversation", default="Conv_MOD_P1_P2", help="column of the conversation IDs (default: %(default)s)")
+    parser.add_argument("--window", type=int, default=1, help="number of last turns of every speaker available for repetition, 0 for no limit (default: %(default)s)")
+    parser.add_argument("--seconds", type=float, default=None, help="only the turns which ended less than this many seconds before are available for repetition (default: no limit)")
+    parser.add_argument("--model", default="en_core_web_sm", help="spaCy model (default: %(default)s)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="number of sentences spaCy annotates at once (default: %(default)s)")
+    parser.add_argument("--n-process", type=int, default=1, help="number of processes spaCy uses to annotate, -1 for all the CPUs (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=1, help="number of conversations processed in parallel (default: %(default)s)")
+    parser.add_argument("--chunksize", type=int, default=None, help="number of lines read at once to stream large files (default: the whole file at once)")
+    parser.add_argument("--cache", default=None, help="SQLite file keeping the annotated turns from one run to another (default: no cache)")
+    parser.add_argument("--cache-size", type=int, default=1000000, help="maximum number of turns kept in the cache (default: %(default)s)")
+    parser.add_argument("--incremental", action="store_true", help="only recompute the conversations that changed since the last run, as recorded in <output>.manifest.json (csv only, without --chunksize)")
+    parser.add_argument("--index", default=None, help="SQLite file saving the index of the n-grams of all turns, for first-occurrence, reuse and alignment queries (see BME_Index.py; not with --incremental)")
+    parser.add_argument("--report", default=None, help="JSON file reporting the time spent per stage and the throughput per conversation (default: no report)")
+    parser.add_argument("--profile", default=None, help="file saving a cProfile of the run, whose top functions are also added to the report (default: no profile)")
+    args = parser.parse_args(argv)
+    if args.incremental and (args.chunksize or args.format != "csv"):
+        parser.error("--incremental works on csv outputs held in memory (no --chunksize, no --format parquet)")
+    if args.incremental and args.index:
+        parser.error("--index needs all the conversations to be computed (not with --incremental)")
+
+    if args.report or args.profile:
+        instruments.enabled = True
+        instruments.resets()
+    if args.profile:
+        instruments.starts_profile()
+
+    ngram_sizes = range(args.ngrams[0], args.ngrams[1] + 1) # n-gram sizes for which the repetitions are calculated.
+    window = args.window or None # history window of the register, in turns per speaker (None: no limit).
+
+    index = NgramIndex() if args.index else None
+
+    cache = None
+    if args.cache:
+        cache = AnnotationCache(args.cache, models_signature(args.model), args.cache_size)
+
+    if args.incremental:
+        _, stats = runs_incremental(args.input, args.output, ngram_sizes, args.speakers, workers=args.workers, batch_size=args.batch_size,
+                                    n_process=args.n_process, model_name=args.model, cache=cache, conversation_column=args.conversation,
+                                    window=window, seconds=args.seconds)
+        print(f"{stats['recomputed']} of {stats['conversations']} conversations recomputed.")
+
+    elif args.chunksize:
+        streams_pipeline(args.input, args.output, ngram_sizes, args.speakers, chunksize=args.chunksize, workers=args.workers,
+                         batch_size=args.batch_size, n_process=args.n_process, model_name=args.model, cache=cache, output_format=args.format,
+                         conversation_column=args.conversation, window=window, seconds=args.seconds, index=index)
+
+    else:
+        df = pd.read_csv(args.input)
+        df = runs_pipeline(df, ngram_sizes, args.speakers, workers=args.workers, batch_size=args.batch_size,
+                           n_process=args.n_process, model_name=args.model, cache=cache, conversation_column=args.conversation,
+                           window=window, seconds=args.seconds, index=index)
+
+        #SaveFile :
+        with instruments.stage("write"):
+            if args.format == "parquet":
+                parquet_output = ParquetOutput(args.output, args.speakers, ngram_sizes, args.conversation)
+                parquet_output.writes(df)
+                parquet_output.close()
+            else:
+                df.to_csv(args.output)
+
+    print(f"Output {parquet_paths(args.output)[0] if args.format == 'parquet' else args.output} has been created.")
+
+    if index is not None:
+        index.writes(args.index)
+        print(f"Index {args.index} has been created.")
+
+    profile = instruments.stops_profile(args.profile) if args.profile else None
+    if args.report:
+        instruments.writes(args.report, cache=cache.stats() if cache is not None else None, profile=profile)
+        print(f"Report {args.report} has been created.")
+
+    if cache is not None:
+        print("Annotation cache:", cache.stats())
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
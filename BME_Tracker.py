@@ -0,0 +1,135 @@
+##Online repetition tracker##
+
+# Counts the repetitions of turns given one at a time, e.g. live from a transcription feed, instead of a whole dataframe at once.
+# - The register of every conversation is kept between turns (see Register in BME_Repetitions.py), one per n-gram size,
+#   so every turn is compared with the previous ones exactly as in counts_repetitions().
+# - A turn is given with its speaker, text, BME tag (see the BME method) and, for a window in seconds, its start and end times.
+#   B_W and B_M turns are counted; M and E lines get the metrics of the speaker's last B_ turn (as fills_lines() does);
+#   lines where the speaker doesn't speak ("0") get None.
+# - The metrics are returned for all n-gram sizes, as {column: value} with the columns of the output of BME_Repetitions.py.
+# - counts_turns() tags several turns with a single call to spaCy; counts_turn_async() gathers the turns given concurrently
+#   in an asyncio program, and tags them together in a thread, so the event loop keeps running meanwhile.
+
+# Usage:
+#   tracker = RepetitionTracker(range(1, 4))
+#   metrics = tracker.counts_turn("S02_M001", "P1", "yes I think so", "B_W", start=12.1, end=13.4)
+
+#imports#
+import asyncio # for counts_turn_async()
+from BME_Repetitions import Register, adds_to_register, annotates_sentence, counts_rep, gets_model, normalises_turn
+from BME_Instruments import instruments # to measure where the time goes
+
+
+class RepetitionTracker:
+
+    def __init__(self, ngram_sizes=range(1, 4), window=1, seconds=None, model_name=None, cache=None, batch_size=1000, batch_delay=0):
+        self.ngram_sizes = list(ngram_sizes)
+        self.window = window # history window of the registers (see Register)
+        self.seconds = seconds
+        self.model_name = model_name # spaCy model, loaded on first use (see gets_model() in BME_Repetitions.py)
+        self.cache = cache # AnnotationCache (see BME_Cache.py), or None
+        self.batch_size = batch_size # number of sentences spaCy annotates at once
+        self.batch_delay = batch_delay # seconds counts_turn_async() waits for other turns before tagging
+        self.registers = {} # conversation -> {n-gram size: Register}
+        self.last_metrics = {} # conversation -> {speaker's ID: metrics of the speaker's last B_ turn}
+        self.waiting = [] # (turn, future) given to counts_turn_async() and not tagged yet
+        self.flushing = None # task counting the turns given to counts_turn_async(), if any
+
+    def annotates(self, strings): # annotates the turns with a single call to spaCy (and the cache, if any): {string: tokens}
+        strings = list(dict.fromkeys(strings)) # every turn once
+        annotated = self.cache.gets(strings) if self.cache is not None else {}
+        new_strings = [string for string in strings if string not in annotated]
+
+        if new_strings:
+            from spacy.tokens import Doc # the sentences are already split in words, so they are given to spaCy as Doc objects.
+            model = gets_model(self.model_name)
+            tokens = {string: [] for string in new_strings}
+            docs = ((Doc(model.vocab, words=words), string) for string in new_strings for words in normalises_turn(string))
+            with instruments.stage("tag"):
+                for sent, string in model.pipe(docs, as_tuples=True, batch_size=self.batch_size):
+                    tokens[string].extend(annotates_sentence(sent))
+            new_turns = {string: tuple(tokens[string]) for string in new_strings}
+            if self.cache is not None:
+                self.cache.puts(new_turns)
+            annotated.update(new_turns)
+
+        return(annotated)
+
+    def counts(self, conversation, speaker, tokens, start=None, end=None): # counts the repetitions of an annotated B_ turn, and adds it to the registers.
+        if conversation not in self.registers:
+            self.registers[conversation] = {ngram: Register(self.window, self.seconds) for ngram in self.ngram_sizes}
+        registers = self.registers[conversation]
+        metrics = {}
+
+        for ngram in self.ngram_sizes:
+            register = registers[ngram]
+            if self.seconds is not None and start is not None: # drops the turns which ended too long before this one.
+                register.advances(start)
+            list_of_ngrams, count_repeated = counts_rep(speaker, tokens, register, ngram)
+            adds_to_register(speaker, list_of_ngrams[""], register, end)
+
+            for C in ["", "OC", "CC"]:
+                for p in ["self", "other"]:
+                    suffix = "_"+str(ngram)+"n"
+                    metrics[speaker+"_"+C+"_"+p+"_repeated"+suffix] = count_repeated[p]["repeated"][C]
+                    metrics[speaker+"_"+C+"_"+p+"_nonrepeated"+suffix] = count_repeated[p]["nonrepeated"][C]
+                    metrics[speaker+"_"+C+"_"+p+"_length"+suffix] = len(list_of_ngrams[C])
+                    metrics[speaker+"_"+C+"_"+p+"_jaccard_index"+suffix] = count_repeated[p]["jaccard_index"][C]
+                    metrics[speaker+"_"+C+"_"+p+"_repetition"+suffix] = count_repeated[p]["repetition"][C]
+
+        self.last_metrics.setdefault(conversation, {})[speaker] = metrics
+        return(metrics)
+
+    def counts_turns(self, turns, annotated=None): # counts a list of turns (dicts of the arguments of counts_turn()), in order, tagging them all at once
+        # (unless they were already: annotated is then {text: tokens}, as returned by annotates()).
+        turns = [dict({"bme": "B_W", "start": None, "end": None}, **turn) for turn in turns]
+        if annotated is None:
+            annotated = self.annotates([str(turn["text"]) for turn in turns if turn["bme"] in ["B_W", "B_M"]])
+
+        results = []
+        for turn in turns:
+            if turn["bme"] in ["B_W", "B_M"]: # a new turn (see the BME method)
+                results.append(self.counts(turn["conversation"], turn["speaker"], annotated[str(turn["text"])], turn["start"], turn["end"]))
+            elif turn["bme"] in ["M", "E_M", "E_W"] and turn["speaker"] in self.last_metrics.get(turn["conversation"], {}): # same turn, continued
+                last = self.last_metrics[turn["conversation"]][turn["speaker"]]
+                results.append({column: "" if "_repetition_" in column else value for column, value in last.items()})
+            else: # the speaker doesn't speak
+                results.append(None)
+        return(results)
+
+    def counts_turn(self, conversation, speaker, text, bme="B_W", start=None, end=None): # counts a single turn, and returns its metrics.
+        return(self.counts_turns([{"conversation": conversation, "speaker": speaker, "text": text, "bme": bme, "start": start, "end": end}])[0])
+
+    async def counts_turn_async(self, conversation, speaker, text, bme="B_W", start=None, end=None): # counts_turn(), tagged with the turns given at the same time.
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.waiting.append(({"conversation": conversation, "speaker": speaker, "text": text, "bme": bme, "start": start, "end": end}, future))
+        if self.flushing is None: # no batch being counted: starts one, which the turns given meanwhile join.
+            self.flushing = loop.create_task(self.flushes())
+        return(await future)
+
+    async def flushes(self): # counts the turns waiting in counts_turn_async() batch by batch, in the order they were given.
+        loop = asyncio.get_running_loop()
+        try:
+            while self.waiting:
+                await asyncio.sleep(self.batch_delay) # waits for the turns given meanwhile.
+                batch, self.waiting = self.waiting, []
+                turns = [turn for turn, _ in batch]
+                try:
+                    # tagged in a thread, so the event loop keeps running; the turns given meanwhile make the next batch.
+                    annotated = await loop.run_in_executor(None, self.annotates, [str(turn["text"]) for turn in turns if turn["bme"] in ["B_W", "B_M"]])
+                    results = self.counts_turns(turns, annotated)
+                except Exception as error:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(error)
+                    continue
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            self.flushing = None
+
+    def ends_conversation(self, conversation): # forgets the registers of a conversation that is over.
+        self.registers.pop(conversation, None)
+        self.last_metrics.pop(conversation, None)
@@ -0,0 +1 @@
+# Benchmarks of the repetition pipeline (see run_benchmarks.py), on synthetic BME corpora (see synthetic_corpus.py).
@@ -0,0 +1,185 @@
+##Benchmarks##
+
+# Times the steps of the repetition pipeline (BME_Repetitions.py) on synthetic corpora of several scales (see synthetic_corpus.py):
+# my_tokenizer, annotates_corpus, counts_rep, adds_to_register, fills_lines, the whole runs_pipeline, and the online
+# RepetitionTracker fed one turn at a time (its per-turn latency is seconds / items), and, with scipy, the turn x turn
+# matrices and previous-turn metrics of BME_Matrix.py.
+# By default, turns are tagged by the stand-in tagger (see standin_tagger.py), so no spaCy model is needed and runs are
+# comparable from one machine to another; --model times a real spaCy model instead.
+# The results (best time of --repeat runs, and throughput) are saved as JSON. --compare checks them against a previous
+# JSON file, and fails if a benchmark has become slower by more than --tolerance.
+
+# Usage: python -m benchmarks.run_benchmarks --scales small medium -o benchmark_results.json [--compare previous.json]
+
+#imports#
+import argparse # for the command line
+import datetime # to date the results
+import importlib.util # to know whether scipy is installed
+import json # to save the results
+import platform # to describe the machine
+import subprocess # to know the version of the code
+import sys # to exit with an error on regressions
+import time # to time the steps
+import pandas as pd # for dataframes
+
+import BME_Repetitions as bme
+from BME_Tracker import RepetitionTracker
+from benchmarks.standin_tagger import builds_standin_model
+from benchmarks.synthetic_corpus import generates_corpus, speakers_of
+
+# scales of the synthetic corpora: conversations, turns per conversation, mean words per turn, speakers
+SCALES = {"small": {"conversations": 18, "turns": 20, "words_per_turn": 10, "speakers": 3},
+          "medium": {"conversations": 100, "turns": 100, "words_per_turn": 12, "speakers": 3},
+          "large": {"conversations": 400, "turns": 250, "words_per_turn": 15, "speakers": 3},
+          "long_turns": {"conversations": 20, "turns": 100, "words_per_turn": 80, "speakers": 3},
+          "four_party": {"conversations": 100, "turns": 100, "words_per_turn": 12, "speakers": 4}}
+
+NGRAM_SIZES = range(1, 4)
+
+
+# best_time() runs a function several times and returns the shortest wall time, and the result of the last run.
+def best_time(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return(best, result)
+
+
+# replays_register() counts the repetitions of all annotated turns, as counts_repetitions() does, and returns the time
+# spent in counts_rep() and in adds_to_register(), with a history window of `window` turns per speaker.
+def replays_register(df, annotated_turns, speakers, conversation_column, window=1):
+    timings = {"counts_rep": 0.0, "adds_to_register": 0.0}
+    conversations = df[conversation_column].to_numpy()
+
+    for ngram in NGRAM_SIZES:
+        conversation = None
+        for i, l in enumerate(df.index):
+            if conversations[i] != conversation:
+                register = bme.Register(window)
+                conversation = conversations[i]
+            for ID in speakers:
+                if l in annotated_turns[ID]:
+                    start = time.perf_counter()
+                    list_of_ngrams, _ = bme.counts_rep(ID, annotated_turns[ID][l], register, ngram)
+                    middle = time.perf_counter()
+                    bme.adds_to_register(ID, list_of_ngrams[""], register)
+                    timings["counts_rep"] += middle - start
+                    timings["adds_to_register"] += time.perf_counter() - middle
+    return(timings)
+
+
+# runs_scale() runs all the benchmarks on a synthetic corpus of the given scale.
+def runs_scale(name, scale, repeat, workers, window=1):
+    df = generates_corpus(scale["conversations"], scale["turns"], scale["words_per_turn"], scale["speakers"], seed=0)
+    speakers = speakers_of(scale["speakers"])
+    conversation_column = "Conv_" + "_".join(speakers)
+
+    turns = [str(df["Tag_Turn_"+ID][l]) for ID in speakers for l in df.index[df["BME_Turn_"+ID].isin(["B_W","B_M"])]]
+    sentences = [sent for turn in turns for sent in bme.splits_sentences(turn)]
+    results = []
+
+    def adds(benchmark, items, seconds):
+        results.append({"scale": name, "benchmark": benchmark, "items": items, "seconds": seconds,
+                        "items_per_second": items / seconds if seconds else None})
+        print(f"{name:>12} {benchmark:>21}: {seconds:9.4f} s  ({items} items)")
+
+    seconds, _ = best_time(lambda: [bme.my_tokenizer(sent) for sent in sentences], repeat)
+    adds("my_tokenizer", len(sentences), seconds)
+
+    seconds, annotated_turns = best_time(lambda: bme.annotates_corpus(df, speakers), repeat)
+    adds("annotates_corpus", len(turns), seconds)
+
+    timings = min((replays_register(df, annotated_turns, speakers, conversation_column, window) for _ in range(repeat)),
+                  key=lambda timings: sum(timings.values()))
+    adds("counts_rep", len(turns) * len(NGRAM_SIZES), timings["counts_rep"])
+    adds("adds_to_register", len(turns) * len(NGRAM_SIZES), timings["adds_to_register"])
+
+    counted = pd.concat([df, bme.counts_repetitions(df, annotated_turns, NGRAM_SIZES, speakers, conversation_column, window)], axis=1)
+    seconds, _ = best_time(lambda: bme.fills_lines(counted.copy(), speakers, NGRAM_SIZES), repeat)
+    adds("fills_lines", len(df), seconds)
+
+    seconds, _ = best_time(lambda: bme.runs_pipeline(df, NGRAM_SIZES, speakers, workers=workers, conversation_column=conversation_column, window=window), repeat)
+    adds("end_to_end", len(df), seconds)
+
+    fed = [{"conversation": df[conversation_column][l], "speaker": ID, "text": df["Tag_Turn_"+ID][l], "bme": df["BME_Turn_"+ID][l]}
+           for l in df.index for ID in speakers if str(df["BME_Turn_"+ID][l]) != "0"]
+    def tracks():
+        tracker = RepetitionTracker(NGRAM_SIZES, window)
+        return([tracker.counts_turn(**turn) for turn in fed])
+    seconds, _ = best_time(tracks, repeat)
+    adds("tracker", len(fed), seconds)
+
+    if importlib.util.find_spec("scipy") is not None: # the matrix mode is optional
+        import BME_Matrix as bm
+        seconds, _ = best_time(lambda: bm.turn_matrices(df, annotated_turns, NGRAM_SIZES, speakers, conversation_column), repeat)
+        adds("turn_matrices", len(turns), seconds)
+        seconds, _ = best_time(lambda: bm.previous_turn_metrics(df, annotated_turns, NGRAM_SIZES, speakers, conversation_column, window), repeat)
+        adds("previous_turn_metrics", len(turns), seconds)
+
+    return(results)
+
+
+# compares() returns the benchmarks whose throughput dropped by more than tolerance since the previous results.
+def compares(results, previous, tolerance):
+    previous = {(result["scale"], result["benchmark"]): result for result in previous["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get((result["scale"], result["benchmark"]))
+        if before and before["items_per_second"] and result["items_per_second"]:
+            ratio = result["items_per_second"] / before["items_per_second"]
+            print(f"{result['scale']:>12} {result['benchmark']:>21}: x{ratio:.2f} throughput")
+            if ratio < 1 - tolerance:
+                regressions.append(dict(result, ratio=ratio))
+    return(regressions)
+
+
+# version() returns the git commit of the code, if any.
+def version():
+    try:
+        return(subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip())
+    except(OSError, subprocess.CalledProcessError):
+        return(None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the repetition pipeline on synthetic BME corpora.")
+    parser.add_argument("--scales", nargs="+", default=["small", "medium"], choices=list(SCALES), help="corpus scales (default: small medium)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of every benchmark, the best is kept (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=1, help="workers of the end-to-end run (default: %(default)s)")
+    parser.add_argument("--window", type=int, default=1, help="history window of the register, in turns per speaker (default: %(default)s)")
+    parser.add_argument("--model", default=None, help="spaCy model to time instead of the stand-in tagger")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="JSON file of the results (default: %(default)s)")
+    parser.add_argument("--compare", default=None, help="JSON file of previous results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="accepted drop of throughput when comparing (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    bme.loads_model(args.model or builds_standin_model())
+
+    results = []
+    for name in args.scales:
+        results.extend(runs_scale(name, SCALES[name], args.repeat, args.workers, args.window))
+
+    report = {"created": datetime.datetime.now().isoformat(timespec="seconds"),
+              "version": version(),
+              "python": platform.python_version(),
+              "machine": platform.platform(),
+              "tagger": args.model or "stand-in",
+              "repeat": args.repeat,
+              "window": args.window,
+              "results": results}
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results {args.output} have been created.")
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compares(results, json.load(file), args.tolerance)
+        if regressions:
+            print("Throughput regressions:", ", ".join(f"{r['scale']}/{r['benchmark']}" for r in regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+##Stand-in tagger##
+
+# A lightweight replacement for the spaCy model, so the benchmarks (and tests) run without downloading en_core_web_sm.
+# It is a blank English spaCy pipeline with a single component giving a POS to every token: closed-class words from a
+# lookup table, open-class words from their suffix. Every token also gets a dependency label, as annotates_sentence()
+# only keeps the sentences that have dependencies.
+# The POS are not those of a real model, so the counts differ from the real ones; the amount of work is the same.
+
+#imports#
+import spacy # for the blank pipeline
+from spacy.language import Language # to register the component
+
+CLOSED_CLASS = {"PRON": ["i", "you", "he", "she", "it", "we", "they", "me", "him", "her", "us", "them", "that", "what", "which", "who"],
+                "DET": ["the", "a", "an", "this", "these", "those", "some", "any", "all", "every", "no"],
+                "ADP": ["of", "to", "in", "on", "at", "for", "with", "about", "from", "by", "into", "like"],
+                "AUX": ["is", "are", "was", "were", "be", "been", "am", "re", "s", "m", "ll", "ve", "d", "do", "does", "did",
+                        "have", "has", "had", "will", "would", "can", "could", "should", "n", "t"],
+                "CCONJ": ["and", "or", "but", "so"],
+                "SCONJ": ["if", "because", "when", "while", "than"],
+                "INTJ": ["ok", "okay", "yes", "yeah", "no", "mhmm", "mhm", "hmm", "uh", "um", "eh", "ah", "oh", "hi", "hello", "laugh"],
+                "PART": ["not", "up", "out"],
+                "NUM": ["one", "two", "three", "four", "five", "hundred"]}
+
+POS = {word: pos for pos, words in CLOSED_CLASS.items() for word in words}
+
+
+# tags_word() returns the POS of a word: from the lookup table, otherwise from its suffix.
+def tags_word(word):
+    if word in POS:
+        return(POS[word])
+    if word.endswith(("ing", "ed", "ise", "ize")):
+        return("VERB")
+    if word.endswith("ly"):
+        return("ADV")
+    if word.endswith(("ful", "ous", "ive", "al", "able")):
+        return("ADJ")
+    return("NOUN")
+
+
+@Language.component("bme_standin_tagger")
+def standin_tagger(doc):
+    for token in doc:
+        token.pos_ = tags_word(token.text)
+        token.dep_ = "dep"
+    return(doc)
+
+
+# builds_standin_model() returns the stand-in model, to be given to loads_model() in BME_Repetitions.py.
+def builds_standin_model():
+    nlp = spacy.blank("en")
+    nlp.add_pipe("bme_standin_tagger")
+    return(nlp)
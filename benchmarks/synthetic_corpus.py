@@ -0,0 +1,155 @@
+##Synthetic BME corpus##
+
+# Generates conversations in the same format as "input_example.csv" (see the BME method), at any scale:
+# - every line is a B (a turn begins) or E (a turn ends) event, with the Time of the event;
+# - for every speaker: Tag_Turn (text of the turn), BME_Turn (B_W/E_W for a turn spanning a single line, B_M/M/E_M otherwise,
+#   0 when the speaker isn't speaking), N_Turn, STT_Turn/ETT_Turn (start and end of the turn) and Duration_Turn;
+# - the conversation ID in Conv_<speakers> (e.g. Conv_MOD_P1_P2).
+# Turns are made of a Zipf-distributed vocabulary, with backchannels ("ok", "mhmm"), BME annotations ("[laugh]", "[eh]"),
+# punctuation, overlaps between speakers, and words taken from the previous turns, so there is repetition to count.
+
+# Usage: python -m benchmarks.synthetic_corpus --conversations 100 --turns 200 --words 12 --speakers 3 -o synthetic.csv
+
+#imports#
+import argparse # for the command line
+import itertools # to weight the vocabulary
+import random # to draw the conversations
+import pandas as pd # for dataframes
+
+CLOSED_WORDS = ["i", "you", "we", "it", "they", "the", "a", "this", "that", "of", "to", "in", "on", "for", "with", "about",
+                "and", "but", "so", "if", "is", "are", "was", "would", "can", "do", "not", "what", "which", "one", "three"]
+CONTRACTIONS = ["we're", "i'm", "don't", "it's", "that's", "you're", "i'll"]
+BACKCHANNELS = ["ok", "mhmm", "yeah", "yes", "right", "hmm", "ok ok"]
+ANNOTATIONS = ["[laugh]", "[eh]", "[i]", "[uhm]"]
+SYLLABLES = ["ka", "lo", "mi", "ter", "sun", "pa", "ri", "quiz", "an", "swer", "po", "pu", "lar", "rank", "ing", "ed", "ly", "ous"]
+
+
+# speakers_of() returns the names of k speakers: the moderator and k-1 participants.
+def speakers_of(k):
+    return(["MOD"] + ["P"+str(i) for i in range(1, k)])
+
+
+# builds_vocabulary() returns open-class words, with Zipf weights (the first words are the most frequent).
+def builds_vocabulary(rng, size=2000):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    words = sorted(words)
+    rng.shuffle(words)
+    return(words, list(itertools.accumulate(1 / (rank + 1) for rank in range(size))))
+
+
+# writes_turn() draws the text of a turn of about words_per_turn words, reusing words of the previous turns now and then.
+def writes_turn(rng, vocabulary, weights, history, words_per_turn):
+    if rng.random() < 0.2:
+        return(rng.choice(BACKCHANNELS).capitalize() + rng.choice(["", ".", "?"]))
+
+    length = max(1, int(rng.expovariate(1 / words_per_turn)))
+    words = []
+    while len(words) < length:
+        draw = rng.random()
+        if history and draw < 0.15: # repeats a few words of a previous turn.
+            previous = rng.choice(history[-6:])
+            start = rng.randrange(len(previous))
+            words.extend(previous[start:start + rng.randint(1, 3)])
+        elif draw < 0.55:
+            words.append(rng.choice(CLOSED_WORDS))
+        elif draw < 0.6:
+            words.append(rng.choice(CONTRACTIONS))
+        elif draw < 0.63:
+            words.append(rng.choice(ANNOTATIONS))
+        else:
+            words.append(rng.choices(vocabulary, cum_weights=weights)[0])
+    spoken = [word for word in words if word not in ANNOTATIONS]
+    if spoken:
+        history.append(spoken)
+
+    text = ""
+    for i, word in enumerate(words):
+        text += (" " if i else "") + word
+        if i < len(words) - 1 and rng.random() < 0.12:
+            text += rng.choice([".", ",", "?", "!"])
+    return(text[:1].upper() + text[1:] + rng.choice([".", "", "?"]))
+
+
+# generates_conversation() returns the lines of one conversation.
+def generates_conversation(rng, conversation_id, speakers, turns, words_per_turn, overlap, vocabulary, weights):
+    history = []
+    time = 0.0
+    speaking_until = {ID: 0.0 for ID in speakers} # end of the last turn of every speaker
+    all_turns = []
+
+    for k in range(turns):
+        ID = speakers[0] if k == 0 else rng.choice(speakers)
+        text = writes_turn(rng, vocabulary, weights, history, words_per_turn)
+        duration = round(0.25 * len(text.split()) + rng.uniform(0.2, 1.0), 3)
+
+        start = max(time, speaking_until[ID])
+        end = round(start + duration, 3)
+        all_turns.append({"ID": ID, "text": text, "start": start, "end": end})
+        speaking_until[ID] = end
+
+        if rng.random() < overlap: # the next turn starts while this one is still going.
+            time = round(start + duration * rng.uniform(0.1, 0.9), 3)
+        else:
+            time = end
+
+    # every event is a line; at the same time, the ends (E) come before the beginnings (B).
+    events = sorted({(turn["start"], 1) for turn in all_turns} | {(turn["end"], 0) for turn in all_turns})
+    line_of = {event: i for i, event in enumerate(events)}
+    lines = [{"Time": time, "BE_line": "B" if kind else "E"} for time, kind in events]
+    for line in lines:
+        for ID in speakers:
+            line.update({"Tag_Turn_"+ID: "", "BME_Turn_"+ID: 0, "N_Turn_"+ID: None, "STT_Turn_"+ID: None,
+                         "ETT_Turn_"+ID: None, "Duration_Turn_"+ID: None})
+        line["Conv_"+"_".join(speakers)] = conversation_id
+
+    for turn in all_turns:
+        first, last = line_of[(turn["start"], 1)], line_of[(turn["end"], 0)]
+        whole = last == first + 1 # the turn spans a single line
+        for i in range(first, last + 1):
+            ID = turn["ID"]
+            if i == first:
+                bme = "B_W" if whole else "B_M"
+            elif i == last:
+                bme = "E_W" if whole else "E_M"
+            else:
+                bme = "M"
+            lines[i].update({"Tag_Turn_"+ID: turn["text"], "BME_Turn_"+ID: bme,
+                             "N_Turn_"+ID: float(0 if whole else min(i - first, last - first - 1)),
+                             "STT_Turn_"+ID: turn["start"], "ETT_Turn_"+ID: turn["end"],
+                             "Duration_Turn_"+ID: round(turn["end"] - turn["start"], 3)})
+    return(lines)
+
+
+# generates_corpus() returns a dataframe of several conversations, as read from an input file by BME_Repetitions.py.
+def generates_corpus(conversations=18, turns=20, words_per_turn=10, speakers=3, overlap=0.2, seed=0):
+    rng = random.Random(seed)
+    vocabulary, weights = builds_vocabulary(rng)
+    speakers = speakers_of(speakers)
+
+    lines = []
+    for c in range(conversations):
+        conversation_id = "S%03d_M%03d_" % (c, c % 10) + "_".join("P%03d" % rng.randrange(1000) for _ in speakers[1:])
+        lines.extend(generates_conversation(rng, conversation_id, speakers, turns, words_per_turn, overlap, vocabulary, weights))
+    return(pd.DataFrame(lines))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generates a synthetic corpus in the BME format.")
+    parser.add_argument("-o", "--output", default="synthetic.csv", help="output csv file (default: %(default)s)")
+    parser.add_argument("--conversations", type=int, default=18, help="number of conversations (default: %(default)s)")
+    parser.add_argument("--turns", type=int, default=20, help="number of turns per conversation (default: %(default)s)")
+    parser.add_argument("--words", type=int, default=10, help="mean number of words per turn (default: %(default)s)")
+    parser.add_argument("--speakers", type=int, default=3, help="number of speakers, the moderator included (default: %(default)s)")
+    parser.add_argument("--overlap", type=float, default=0.2, help="probability that a turn overlaps the next one (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    df = generates_corpus(args.conversations, args.turns, args.words, args.speakers, args.overlap, args.seed)
+    df.to_csv(args.output)
+    print(f"Corpus {args.output} has been created ({len(df)} lines).")
+
+
+if __name__ == "__main__":
+    main()
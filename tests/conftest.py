@@ -0,0 +1,15 @@
+# Fixtures shared by the tests.
+import pytest
+
+
+@pytest.fixture
+def standin_model():
+    # loads the stand-in tagger (see benchmarks/standin_tagger.py) as the model of BME_Repetitions.py, and puts the previous one back after the test.
+    pytest.importorskip("spacy")
+    import BME_Repetitions as bme
+    from benchmarks.standin_tagger import builds_standin_model
+
+    previous = bme.nlp
+    model = bme.loads_model(builds_standin_model())
+    yield model
+    bme.nlp = previous
@@ -0,0 +1,48 @@
+# Tests of the on-disk annotation cache (see BME_Cache.py).
+import pytest
+
+from BME_Cache import AnnotationCache
+
+TOKENS = (("ok", "INTJ", "closed"), ("quiz", "NOUN", "open"))
+
+
+def test_cache_keeps_turns_between_runs(tmp_path):
+    cache = AnnotationCache(str(tmp_path / "cache.sqlite"), "en_core_web_sm-3.7.1")
+    assert cache.gets(["Ok quiz."]) == {}
+    cache.puts({"Ok quiz.": TOKENS})
+    cache.close()
+
+    cache = AnnotationCache(str(tmp_path / "cache.sqlite"), "en_core_web_sm-3.7.1")
+    # the normalised text is the same (lowercase, single spaces).
+    assert cache.gets(["Ok quiz.", "ok   QUIZ."]) == {"Ok quiz.": TOKENS, "ok   QUIZ.": TOKENS}
+    assert cache.stats()["hits"] == 2
+
+    # another model doesn't share the annotations.
+    other_model = AnnotationCache(str(tmp_path / "cache.sqlite"), "en_core_web_lg-3.7.1")
+    assert other_model.gets(["Ok quiz."]) == {}
+    assert other_model.stats()["misses"] == 1
+
+
+def test_cache_evicts_least_recently_used_turns(tmp_path):
+    cache = AnnotationCache(str(tmp_path / "cache.sqlite"), "model", max_entries=2)
+    cache.puts({"first": TOKENS})
+    cache.puts({"second": TOKENS})
+    cache.gets(["first"])
+    cache.puts({"third": TOKENS})
+
+    assert set(cache.gets(["first", "second", "third"])) == {"first", "third"}
+
+
+def test_models_signature_is_the_same_before_and_after_loading(tmp_path, monkeypatch):
+    pytest.importorskip("spacy")
+    import BME_Repetitions as bme
+    from benchmarks.standin_tagger import builds_standin_model
+
+    model = builds_standin_model()
+    model.to_disk(tmp_path / "model")
+    monkeypatch.setattr(bme, "nlp", None)
+    unloaded = bme.models_signature(str(tmp_path / "model"))
+    assert bme.nlp is None # read from its meta.json, without loading it
+
+    bme.loads_model(model)
+    assert bme.models_signature(str(tmp_path / "model")) == unloaded == "en_pipeline-0.0.0"
@@ -0,0 +1,38 @@
+# Regression test of the fill-forward of M and E lines (see the BME method) against the provided "output_example.csv".
+import os
+
+import pandas as pd
+
+import BME_Repetitions as bme
+
+OUTPUT_EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "output_example.csv")
+
+
+def test_fills_lines_reproduces_output_example():
+    expected = pd.read_csv(OUTPUT_EXAMPLE, index_col=0)
+    df = expected.copy()
+
+    # blanks every M and E line of the example, so they can only be recovered by the fill-forward.
+    for ID in ["MOD", "P1", "P2"]:
+        columns = [c for c in df.columns if c.startswith(ID+"_") and "_repetition_" not in c]
+        to_fill = df["BME_Turn_"+ID].isin(["M", "E_M", "E_W"]).to_numpy()
+        to_fill[:1] = False
+        df.loc[to_fill, columns] = -1
+
+    assert not df.equals(expected)
+
+    filled = bme.fills_lines(df, ["MOD", "P1", "P2"], range(1,4))
+
+    pd.testing.assert_frame_equal(filled, expected)
+
+
+def test_fills_lines_keeps_first_line_and_chains_m_lines():
+    df = pd.DataFrame({"BME_Turn_MOD": ["E_W", "B_W", "M", "M", "E_W", 0, "B_M"]})
+    for C in ["", "OC", "CC"]:
+        for p in ["self","other"]:
+            for rep in ["repeated", "nonrepeated", "length", "jaccard_index"]:
+                df["MOD_"+C+"_"+p+"_"+rep+"_1n"] = [7, 1, "", "", "", 0, 2]
+
+    filled = bme.fills_lines(df, ["MOD"], [1])
+
+    assert list(filled["MOD__self_repeated_1n"]) == [7, 1, 1, 1, 1, 0, 2]
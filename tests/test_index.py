@@ -0,0 +1,67 @@
+# Tests of the inverted n-gram index (see BME_Index.py): its postings, its queries, and the index built by the pipeline.
+import pytest
+
+from BME_Index import NgramIndex
+
+
+I = ("i", "PRON", "closed")
+THINK = ("think", "VERB", "open")
+SO = ("so", "ADV", "closed")
+
+
+def builds_index():
+    index = NgramIndex()
+    index.adds("conv1", 0, "MOD", 0.0, [(I, THINK), (THINK, SO), (I, THINK)])
+    index.adds("conv1", 4, "MOD", 2.5, [(I, THINK)])
+    index.adds("conv1", 7, "P1", 4.0, [(I, THINK), (THINK, SO)])
+    index.adds("conv2", 1, "P2", float("nan"), [(I, THINK)])
+    index.adds("conv2", 3, "P1", 1.0, [(THINK, SO), (SO, I)])
+    return(index)
+
+
+def test_index_queries():
+    index = builds_index()
+
+    assert index.classes[(I, THINK)] == "OC" and index.classes[(SO, I)] == "CC"
+    assert index.postings_of((I, THINK)) == [("conv1", 0, "MOD", 0.0), ("conv1", 4, "MOD", 2.5), ("conv1", 7, "P1", 4.0), ("conv2", 1, "P2", None)]
+    assert index.first_occurrence("I  think") == ("conv1", 0, "MOD", 0.0)
+    assert index.first_occurrence("think so", "conv2") == ("conv2", 3, "P1", 1.0)
+    assert index.first_occurrence("so what") is None
+
+    assert index.reuse_count("i think") == {"self": 1, "other": 1, "other_conversations": 1}
+    assert index.reuse_count("i think", "conv2") == {"self": 0, "other": 0, "other_conversations": 0}
+
+    assert index.alignment_lag("i think", "conv1") == {"introduced_by": "MOD", "aligned_by": "P1", "lines": 7, "seconds": 4.0}
+    assert index.alignment_lag("think so", "conv2") is None
+
+
+def test_index_file_and_merges(tmp_path):
+    index = builds_index()
+    index.writes(str(tmp_path / "index.sqlite"))
+    read = NgramIndex.reads(str(tmp_path / "index.sqlite"))
+    assert read.postings == index.postings and read.classes == index.classes
+
+    first, second = NgramIndex(), NgramIndex()
+    first.adds("conv1", 0, "MOD", 0.0, [(I, THINK)])
+    second.adds("conv2", 1, "P2", 1.0, [(I, THINK), (THINK, SO)])
+    first.merges(second)
+    assert first.postings_of("i think") == [("conv1", 0, "MOD", 0.0), ("conv2", 1, "P2", 1.0)]
+    assert first.first_occurrence("think so") == ("conv2", 1, "P2", 1.0)
+
+
+def test_pipeline_builds_the_same_index_with_workers(standin_model):
+    import BME_Repetitions as bme
+    from benchmarks.synthetic_corpus import generates_corpus
+
+    df = generates_corpus(conversations=4, turns=15, seed=6)
+    serial, parallel = NgramIndex(), NgramIndex()
+    bme.runs_pipeline(df, range(1, 3), index=serial)
+    bme.runs_pipeline(df, range(1, 3), workers=2, index=parallel)
+    assert serial.postings == parallel.postings
+
+    # every B_ turn is indexed under all its n-grams.
+    annotated_turns = bme.annotates_corpus(df, ["MOD", "P1", "P2"])
+    for ID in ["MOD", "P1", "P2"]:
+        for l, tokens in annotated_turns[ID].items():
+            for ngram in [tuple(tokens[i:i+2]) for i in range(len(tokens) - 1)]:
+                assert (df["Conv_MOD_P1_P2"][l], l, ID) in [posting[:3] for posting in serial.postings[ngram]]
@@ -0,0 +1,27 @@
+# Tests of the instrumentation of a run (see BME_Instruments.py).
+import json
+import time
+
+from BME_Instruments import Instruments
+
+
+def test_stages_exclude_nested_stages(tmp_path):
+    instruments = Instruments()
+    with instruments.stage("tag"): # off by default: nothing is recorded.
+        pass
+    assert instruments.stages == {}
+
+    instruments.enabled = True
+    with instruments.stage("tag"):
+        with instruments.stage("normalize"):
+            time.sleep(0.02)
+    instruments.records_conversation("S01", 4, 0.5)
+
+    assert instruments.stages["tag"]["calls"] == 1
+    assert instruments.stages["tag"]["seconds"] < instruments.stages["normalize"]["seconds"]
+
+    instruments.merges(instruments.report()) # e.g. the report of a worker
+    instruments.writes(str(tmp_path / "report.json"), cache=None)
+    report = json.loads((tmp_path / "report.json").read_text())
+    assert report["stages"]["normalize"]["calls"] == 2
+    assert report["conversations"] == [{"conversation": "S01", "turns": 8, "seconds": 1.0, "turns_per_second": 8.0}]
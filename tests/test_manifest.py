@@ -0,0 +1,101 @@
+# Tests of the incremental re-runs (see runs_incremental() and BME_Manifest.py): the spliced output is the output of a full run.
+import pandas as pd
+import pytest
+
+pytest.importorskip("spacy")
+
+import BME_Repetitions as bme
+from benchmarks.synthetic_corpus import generates_corpus
+
+
+def runs_full(name_input, path):
+    bme.runs_pipeline(pd.read_csv(name_input), range(1, 4)).to_csv(path)
+    with open(path) as file:
+        return(file.read())
+
+
+def test_incremental_run_only_recomputes_changed_conversations(tmp_path, standin_model):
+    model = standin_model
+    df = generates_corpus(conversations=5, turns=15, seed=5)
+    df.to_csv(tmp_path / "input.csv")
+    output = str(tmp_path / "output.csv")
+
+    bme.runs_incremental(str(tmp_path / "input.csv"), output, range(1, 4))
+    with open(output) as file:
+        assert file.read() == runs_full(tmp_path / "input.csv", tmp_path / "full.csv")
+
+    # nothing changed: nothing is tagged.
+    pipe = model.pipe
+    model.pipe = None
+    try:
+        _, stats = bme.runs_incremental(str(tmp_path / "input.csv"), output, range(1, 4))
+    finally:
+        model.pipe = pipe
+    assert stats == {"recomputed": 0, "conversations": 5}
+
+    # a turn corrected in one conversation, and lines removed from another one.
+    line = df.index[(df["Conv_MOD_P1_P2"] == df["Conv_MOD_P1_P2"].unique()[1]) & (df["BME_Turn_P2"] == "B_W")][0]
+    df.loc[line, "Tag_Turn_P2"] = "a brand new turn"
+    df = df.drop(df.index[df["Conv_MOD_P1_P2"] == df["Conv_MOD_P1_P2"].unique()[3]][-2:]).reset_index(drop=True)
+    df.to_csv(tmp_path / "input.csv")
+
+    _, stats = bme.runs_incremental(str(tmp_path / "input.csv"), output, range(1, 4))
+    assert stats["recomputed"] == 2
+    with open(output) as file:
+        assert file.read() == runs_full(tmp_path / "input.csv", tmp_path / "full.csv")
+
+    # other settings: everything is recomputed.
+    _, stats = bme.runs_incremental(str(tmp_path / "input.csv"), output, range(1, 3))
+    assert stats["recomputed"] == 5
+
+
+def test_incremental_run_fills_conversations_from_the_one_before(tmp_path, standin_model):
+    df = generates_corpus(conversations=4, turns=15, seed=6)
+    conversations = df["Conv_MOD_P1_P2"].unique()
+    # the third conversation starts with an E line, which is filled from the last line of the second one.
+    line = df.index[df["Conv_MOD_P1_P2"] == conversations[1]][-1]
+    df.loc[line, ["BME_Turn_P1", "Tag_Turn_P1"]] = ["B_W", "yes I think so"]
+    df.loc[line + 1, "BME_Turn_P1"] = "E_W"
+    df.to_csv(tmp_path / "input.csv")
+    output = str(tmp_path / "output.csv")
+    bme.runs_incremental(str(tmp_path / "input.csv"), output, range(1, 4))
+
+    df.loc[line, "Tag_Turn_P1"] = "a brand new turn"
+    df.to_csv(tmp_path / "input.csv")
+
+    _, stats = bme.runs_incremental(str(tmp_path / "input.csv"), output, range(1, 4))
+    assert stats["recomputed"] == 2
+    with open(output) as file:
+        assert file.read() == runs_full(tmp_path / "input.csv", tmp_path / "full.csv")
+
+    # the first conversation removed: the second one is now the first, and the others keep the conversation before them.
+    df = df[df["Conv_MOD_P1_P2"] != conversations[0]].reset_index(drop=True)
+    df.to_csv(tmp_path / "input.csv")
+
+    _, stats = bme.runs_incremental(str(tmp_path / "input.csv"), output, range(1, 4))
+    assert stats["recomputed"] == 0
+    with open(output) as file:
+        assert file.read() == runs_full(tmp_path / "input.csv", tmp_path / "full.csv")
+
+
+def test_incremental_run_after_another_run_on_the_same_output(tmp_path, standin_model):
+    df = generates_corpus(conversations=3, turns=15, seed=7)
+    df["Notes"] = "checked"
+    df.to_csv(tmp_path / "input.csv")
+    output = str(tmp_path / "output.csv")
+    bme.runs_incremental(str(tmp_path / "input.csv"), output, range(1, 4))
+
+    # a run that isn't incremental rewrites the output, with other settings: its manifest no longer describes it.
+    bme.runs_pipeline(pd.read_csv(tmp_path / "input.csv"), range(1, 4), window=3).to_csv(output)
+    _, stats = bme.runs_incremental(str(tmp_path / "input.csv"), output, range(1, 4))
+    assert stats["recomputed"] == 3
+    with open(output) as file:
+        assert file.read() == runs_full(tmp_path / "input.csv", tmp_path / "full.csv")
+
+    # a column removed from the input isn't copied back from the existing output.
+    df.drop(columns=["Notes"]).to_csv(tmp_path / "input.csv")
+    result, stats = bme.runs_incremental(str(tmp_path / "input.csv"), output, range(1, 4))
+    assert stats["recomputed"] == 0
+    assert "Notes" not in result.columns
+    with open(output) as file:
+        assert file.read() == runs_full(tmp_path / "input.csv", tmp_path / "full.csv")
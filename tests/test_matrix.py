@@ -0,0 +1,100 @@
+# Tests of the sparse-matrix mode (see BME_Matrix.py): pairwise Jaccard matrices, min-hash sketches and similar pairs, and previous-turn metrics.
+import json
+
+import numpy as np
+import pytest
+
+pytest.importorskip("scipy")
+pytest.importorskip("spacy")
+
+import BME_Repetitions as bme
+import BME_Matrix as bm
+from BME_Instruments import instruments
+from benchmarks.synthetic_corpus import generates_corpus
+
+
+SPEAKERS = ["MOD", "P1", "P2"]
+
+
+def annotates(seed): # (with the stand-in model loaded)
+    df = generates_corpus(conversations=3, turns=25, seed=seed)
+    return(df, bme.annotates_corpus(df, SPEAKERS))
+
+
+@pytest.mark.parametrize("window", [1, 3])
+def test_previous_turn_metrics_match_counts_repetitions(window, standin_model):
+    df, annotated_turns = annotates(7)
+    expected = bme.counts_repetitions(df, annotated_turns, range(1, 4), SPEAKERS, window=window)
+    expected = expected[[column for column in expected.columns if "_repetition_" not in column]]
+
+    metrics = bm.previous_turn_metrics(df, annotated_turns, range(1, 4), SPEAKERS, window=window)
+    assert list(metrics.columns) == list(expected.columns)
+    assert metrics.to_csv() == expected.to_csv()
+
+
+def test_turn_matrices_are_pairwise_jaccard_indexes(standin_model):
+    df, annotated_turns = annotates(8)
+    results = bm.turn_matrices(df, annotated_turns, range(1, 3), SPEAKERS)
+    metrics = bme.counts_repetitions(df, annotated_turns, range(1, 3), SPEAKERS)
+
+    for conversation, result in results.items():
+        turns = list(zip(result["turns"]["line"], result["turns"]["speaker"]))
+        for ngram in range(1, 3):
+            sets = [set(bme.splits_ngrams(annotated_turns[ID][l], ngram)[""]) for l, ID in turns]
+            jaccard = (result["matrices"][(ngram, "", "self")] + result["matrices"][(ngram, "", "other")]).toarray()
+            for i, (l, ID) in enumerate(turns):
+                for j, (_, other_ID) in enumerate(turns):
+                    union = len(sets[i] | sets[j])
+                    assert jaccard[i, j] == pytest.approx(len(sets[i] & sets[j]) / union if union else 0)
+                    assert result["matrices"][(ngram, "", "self" if ID == other_ID else "other")][i, j] == jaccard[i, j]
+
+                # the previous-turn "self" Jaccard index is an entry of the matrix, for turns without duplicated n-grams.
+                previous = [j for j, (_, other_ID) in enumerate(turns[:i]) if other_ID == ID]
+                ngrams = bme.splits_ngrams(annotated_turns[ID][l], ngram)[""]
+                if previous and ngrams and len(set(ngrams)) == len(ngrams):
+                    assert jaccard[i, previous[-1]] == pytest.approx(metrics[ID+"__self_jaccard_index_"+str(ngram)+"n"][l])
+
+
+def test_minhash_estimates_and_matrix_file(tmp_path, standin_model):
+    df, annotated_turns = annotates(9)
+    exact = bm.turn_matrices(df, annotated_turns, [1], SPEAKERS)
+    sketches = bm.turn_matrices(df, annotated_turns, [1], SPEAKERS, minhash=256, seed=1)
+    approximate = bm.turn_matrices(df, annotated_turns, [1], SPEAKERS, minhash=256, seed=1, threshold=0.5)
+
+    for conversation in exact:
+        turns = len(exact[conversation]["turns"])
+        # without a threshold, only the min-hashes: no pair of turns is compared.
+        assert sketches[conversation]["matrices"] == {}
+        assert sketches[conversation]["signatures"][(1, "")].shape == (turns, 256)
+        for p in ["self", "other"]:
+            expected = exact[conversation]["matrices"][(1, "", p)].toarray()
+            estimated = approximate[conversation]["matrices"][(1, "", p)].toarray()
+            assert np.abs(estimated - expected)[estimated > 0].max(initial=0) < 0.15 # the pairs kept are well estimated
+            assert (estimated[expected >= 0.7] > 0).all() # and the similar pairs are found
+            assert (estimated[(estimated > 0) & (expected < 0.3)] == 0).all()
+
+    bm.writes_matrices(str(tmp_path / "matrices.npz"), exact)
+    read = bm.reads_matrices(str(tmp_path / "matrices.npz"))
+    for conversation in exact:
+        assert list(read[conversation]["turns"]["line"]) == list(exact[conversation]["turns"]["line"])
+        for key, matrix in exact[conversation]["matrices"].items():
+            assert (read[conversation]["matrices"][key] != matrix).nnz == 0
+
+    bm.writes_matrices(str(tmp_path / "sketches.npz"), sketches)
+    read = bm.reads_matrices(str(tmp_path / "sketches.npz"))
+    for conversation in sketches:
+        for key, signatures in sketches[conversation]["signatures"].items():
+            assert (read[conversation]["signatures"][key] == signatures).all()
+
+
+def test_matrix_command_reports_its_stages(tmp_path, standin_model):
+    df, _ = annotates(10)
+    df.to_csv(tmp_path / "input.csv")
+    try:
+        bm.main(["-i", str(tmp_path / "input.csv"), "-o", str(tmp_path / "matrices.npz"), "--ngrams", "1", "2", "--report", str(tmp_path / "report.json")])
+    finally:
+        instruments.enabled = False
+
+    report = json.loads((tmp_path / "report.json").read_text())
+    assert {"normalize", "tag", "matrix", "write"} <= set(report["stages"])
+    assert set(bm.reads_matrices(str(tmp_path / "matrices.npz"))) == set(df["Conv_MOD_P1_P2"].astype(str))
@@ -0,0 +1,31 @@
+# Tests of the spaCy model used by all functions (see loads_model() and gets_model()).
+import pytest
+
+pytest.importorskip("spacy")
+
+import BME_Repetitions as bme
+from benchmarks.standin_tagger import builds_standin_model
+from benchmarks.synthetic_corpus import generates_corpus
+
+
+def test_loads_model_leaves_the_model_untouched(monkeypatch):
+    model = builds_standin_model()
+    tokenizer = model.tokenizer
+    monkeypatch.setattr(bme, "nlp", None) # (put back after the test)
+    bme.loads_model(model)
+    assert model.tokenizer is tokenizer
+
+    df = generates_corpus(conversations=2, turns=10, seed=3)
+    annotated = bme.annotates_corpus(df, ["P1"])["P1"]
+    for l, tokens in annotated.items():
+        assert bme.annotates_turn(str(df.loc[l, "Tag_Turn_P1"])) == tuple(tokens)
+
+
+def test_my_tokenizer_loads_the_model_on_first_use(monkeypatch):
+    import spacy
+    monkeypatch.setattr(bme, "nlp", None)
+    monkeypatch.setattr(spacy, "load", lambda name: builds_standin_model())
+
+    doc = bme.my_tokenizer("[laugh] Yes, I think so!")
+    assert [token.text for token in doc] == ["laugh", "yes", "i", "think", "so"]
+    assert doc.vocab is bme.nlp.vocab
@@ -0,0 +1,32 @@
+# Tests of the column-wise normalisation of the turns (see normalises_turns()), against the tokens of the original tokeniser:
+# "," "'" "[" "]" replaced by spaces, "!" and "?" by ".", the turn split in sentences on "." and every sentence split on spaces.
+import pandas as pd
+
+import BME_Repetitions as bme
+
+
+TURNS = {"Yes, I think so! And you?": [["yes", "i", "think", "so"], ["and", "you"], []],
+         "[laugh] it's [eh] funny.": [["laugh", "it", "s", "eh", "funny"], []],
+         "ok": [["ok"]],
+         "": [[]],
+         "nan": [["nan"]],
+         "...": [[], [], [], []],
+         "What?! Really... no": [["what"], [], ["really"], [], [], ["no"]]}
+
+
+def test_normalises_turns_matches_the_original_tokens():
+    sentences = bme.normalises_turns(pd.Series(list(TURNS)))
+
+    for l, expected in enumerate(TURNS.values()):
+        assert list(sentences.loc[[l]]) == expected
+
+
+def test_normalises_turn_matches_the_original_tokens():
+    for string, expected in TURNS.items():
+        assert bme.normalises_turn(string) == expected
+
+
+def test_normalises_turns_keeps_bme_annotations():
+    sentences = bme.normalises_turns(pd.Series(["[laugh] Mh, [eh] YES"]))
+
+    assert list(sentences) == [["laugh", "mh", "eh", "yes"]]
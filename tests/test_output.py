@@ -0,0 +1,60 @@
+# Tests of the typed output and its long-format repetition table (see BME_Output.py).
+import numpy as np
+import pandas as pd
+import pytest
+
+from BME_Output import ParquetOutput, metric_columns, repetition_table, types_columns
+
+OK = ("ok", "INTJ", "closed")
+QUIZ = ("quiz", "NOUN", "open")
+
+
+def output_example():
+    df = pd.DataFrame({"Tag_Turn_MOD": ["ok quiz", "ok quiz", "ok"],
+                       "BME_Turn_MOD": ["B_W", "E_W", 0],
+                       "Conv_MOD_P1_P2": ["S01", "S01", "S01"]})
+    for rep, values in {"repeated": [1, 1, ""], "nonrepeated": [0, 0, ""], "length": [2, 2, 0],
+                        "jaccard_index": [0.5, 0.5, ""], "repetition": [[(OK,)], "", ""]}.items():
+        for column in metric_columns(["MOD"], [1])[rep]:
+            df[column] = values
+    return(df)
+
+
+def test_types_columns():
+    typed = types_columns(output_example(), ["MOD"], [1])
+
+    assert typed["MOD__self_repeated_1n"].dtype == "Int32"
+    assert typed["MOD__self_repeated_1n"].isna().tolist() == [False, False, True]
+    assert typed["MOD__self_jaccard_index_1n"].dtype == np.float32
+    assert typed["BME_Turn_MOD"].tolist() == ["B_W", "E_W", "0"]
+    assert not any(column.endswith("_repetition_1n") for column in typed.columns)
+
+
+def test_repetition_table():
+    table = repetition_table(output_example(), ["MOD"], [1])
+
+    assert len(table) == 6 # one repeated n-gram, for self/other and all/OC/CC.
+    assert table.iloc[0].tolist() == ["S01", 0, "MOD", "self", "all", 1, "ok", "INTJ"]
+
+
+def test_parquet_output(tmp_path):
+    pytest.importorskip("pyarrow")
+    output = ParquetOutput(str(tmp_path / "output.parquet"), ["MOD"], [1])
+    output.writes(output_example())
+    output.writes(output_example())
+    output.close()
+
+    assert len(pd.read_parquet(tmp_path / "output.parquet")) == 6
+    assert len(pd.read_parquet(tmp_path / "output_repetitions.parquet")) == 12
+
+
+def test_parquet_output_never_overwrites_a_csv(tmp_path):
+    pytest.importorskip("pyarrow")
+    (tmp_path / "output.csv").write_text("csv output")
+    output = ParquetOutput(str(tmp_path / "output.csv"), ["MOD"], [1])
+    output.writes(output_example())
+    output.close()
+
+    assert (tmp_path / "output.csv").read_text() == "csv output"
+    assert len(pd.read_parquet(tmp_path / "output.parquet")) == 3
+    assert len(pd.read_parquet(tmp_path / "output_repetitions.parquet")) == 6
@@ -0,0 +1,45 @@
+# Tests of the history window of the register (see Register), against the unions of the turns of the window rebuilt every time.
+import random
+
+import pytest
+
+import BME_Repetitions as bme
+
+
+# windowed_union() is the content of the window rebuilt from scratch: the union of the last `window` turns of every speaker
+# which ended at least `seconds` before time.
+def windowed_union(history, ID, window, seconds, time):
+    set_items = {"self": set(), "other": set()}
+    for participant, turns in history.items():
+        kept = turns[-window:] if window else turns
+        if seconds is not None:
+            kept = [(ngrams, end) for ngrams, end in kept if end >= time - seconds]
+        for ngrams, _ in kept:
+            set_items["self" if participant == ID else "other"] |= ngrams
+    return(set_items)
+
+
+@pytest.mark.parametrize("window, seconds", [(1, None), (2, None), (5, None), (None, None), (None, 4.0), (3, 2.5)])
+def test_register_window_matches_rebuilt_unions(window, seconds):
+    rng = random.Random(0)
+    vocabulary = [(("w" + str(k), "NOUN", "open" if k % 3 else "closed"),) for k in range(30)]
+    register = bme.Register(window, seconds)
+    history = {}
+    time = 0.0
+
+    for _ in range(300):
+        ID = rng.choice(["MOD", "P1", "P2"])
+        time += rng.uniform(0, 1.5)
+        register.advances(time)
+        expected = windowed_union(history, ID, window, seconds, time)
+        available = register.available(ID)
+        for p in ["self", "other"]:
+            ids = {register.interns(ngram) for ngram in expected[p]}
+            assert available[p][""] == ids
+            assert available[p]["OC"] == {i for i in ids if register.ngram_classes[i] == "OC"}
+            assert available[p]["CC"] == {i for i in ids if register.ngram_classes[i] == "CC"}
+
+        turn = rng.sample(vocabulary, rng.randint(0, 6))
+        end = max([time + rng.uniform(0, 2)] + [end for _, end in history.get(ID, [])]) # a speaker's turns end in order.
+        bme.adds_to_register(ID, turn, register, end)
+        history.setdefault(ID, []).append((set(turn), end))
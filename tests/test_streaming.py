@@ -0,0 +1,16 @@
+# Tests of the pipeline run on a csv file by chunks of lines (see streams_pipeline()), against the pipeline run in memory.
+import pandas as pd
+
+import BME_Repetitions as bme
+from benchmarks.synthetic_corpus import generates_corpus
+
+
+def test_streamed_pipeline_matches_in_memory_pipeline(tmp_path, standin_model):
+    df = generates_corpus(conversations=5, turns=15, seed=2)
+    df.to_csv(tmp_path / "input.csv")
+
+    in_memory = bme.runs_pipeline(pd.read_csv(tmp_path / "input.csv"), range(1, 4))
+    in_memory.to_csv(tmp_path / "in_memory.csv")
+    bme.streams_pipeline(str(tmp_path / "input.csv"), str(tmp_path / "streamed.csv"), range(1, 4), chunksize=17)
+
+    assert (tmp_path / "in_memory.csv").read_text() == (tmp_path / "streamed.csv").read_text()
@@ -0,0 +1,17 @@
+# Tests of the synthetic BME corpora (see benchmarks/synthetic_corpus.py).
+from benchmarks.synthetic_corpus import generates_corpus, speakers_of
+
+
+def test_synthetic_corpus_follows_the_bme_method():
+    df = generates_corpus(conversations=4, turns=30, speakers=4, seed=1)
+
+    assert df["Conv_MOD_P1_P2_P3"].nunique() == 4
+    for ID in speakers_of(4):
+        for _, lines in df.groupby("Conv_MOD_P1_P2_P3", sort=False):
+            previous = "0"
+            for bme in lines["BME_Turn_"+ID].astype(str):
+                # a turn is B_W E_W, or B_M (M)* E_M.
+                expected = {"0": {"0", "B_W", "B_M"}, "E_W": {"0", "B_W", "B_M"}, "E_M": {"0", "B_W", "B_M"},
+                            "B_W": {"E_W"}, "B_M": {"M", "E_M"}, "M": {"M", "E_M"}}[previous]
+                assert bme in expected
+                previous = bme
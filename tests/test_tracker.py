@@ -0,0 +1,99 @@
+# Tests of the online repetition tracker (see BME_Tracker.py), against the batch pipeline.
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("spacy")
+
+import BME_Repetitions as bme
+from BME_Tracker import RepetitionTracker
+from benchmarks.synthetic_corpus import generates_corpus
+
+
+NGRAM_SIZES = range(1, 4)
+SPEAKERS = ["MOD", "P1", "P2"]
+
+
+# turns_of() lists the lines of the dataframe as turns given to the tracker, speaker by speaker, with the line they come from.
+def turns_of(df):
+    return([(l, {"conversation": df["Conv_MOD_P1_P2"][l], "speaker": ID, "text": df["Tag_Turn_"+ID][l], "bme": df["BME_Turn_"+ID][l],
+                 "start": df["STT_Turn_"+ID][l], "end": df["ETT_Turn_"+ID][l]})
+            for l in df.index for ID in SPEAKERS])
+
+
+def checks_metrics(df, turns, results):
+    for (l, turn), metrics in zip(turns, results):
+        if str(turn["bme"]) == "0":
+            assert metrics is None
+            continue
+        for column, value in metrics.items():
+            assert value == df[column][l], (l, column)
+
+
+@pytest.mark.parametrize("window, seconds", [(1, None), (4, None), (None, 10.0)])
+def test_tracker_matches_pipeline(window, seconds, standin_model):
+    df = generates_corpus(conversations=3, turns=20, seed=3)
+    expected = bme.runs_pipeline(df, NGRAM_SIZES, SPEAKERS, window=window, seconds=seconds)
+
+    tracker = RepetitionTracker(NGRAM_SIZES, window=window, seconds=seconds)
+    turns = turns_of(df)
+    checks_metrics(expected, turns, [tracker.counts_turn(**turn) for _, turn in turns])
+
+
+def test_tracker_async_batches_concurrent_turns(standin_model):
+    model = standin_model
+    df = generates_corpus(conversations=2, turns=10, seed=4)
+    expected = bme.runs_pipeline(df, NGRAM_SIZES, SPEAKERS)
+    turns = turns_of(df)
+
+    pipe, calls = model.pipe, []
+    def counts_pipe(*args, **kwargs):
+        calls.append(kwargs.get("as_tuples", False)) # (spaCy calls pipe() again inside, without as_tuples)
+        return(pipe(*args, **kwargs))
+    model.pipe = counts_pipe
+
+    tracker = RepetitionTracker(NGRAM_SIZES)
+    async def feeds():
+        return(await asyncio.gather(*[tracker.counts_turn_async(**turn) for _, turn in turns]))
+    try:
+        results = asyncio.run(feeds())
+    finally:
+        model.pipe = pipe
+
+    assert calls.count(True) == 1
+    checks_metrics(expected, turns, results)
+
+
+def test_tracker_async_keeps_the_event_loop_running(tmp_path, standin_model):
+    from BME_Cache import AnnotationCache
+
+    model = standin_model
+    df = generates_corpus(conversations=2, turns=10, seed=5)
+    expected = bme.runs_pipeline(df, NGRAM_SIZES, SPEAKERS)
+    turns = turns_of(df)
+
+    pipe = model.pipe
+    def slow_pipe(*args, **kwargs): # a slow tagger
+        time.sleep(0.1)
+        return(pipe(*args, **kwargs))
+    model.pipe = slow_pipe
+
+    tracker = RepetitionTracker(NGRAM_SIZES, cache=AnnotationCache(str(tmp_path / "cache.sqlite"), "stand-in"))
+    ticks = []
+    async def ticks_meanwhile(tagging): # another coroutine, which runs as long as the turns are being tagged
+        while not tagging.done():
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.001)
+    async def feeds():
+        tagging = asyncio.ensure_future(asyncio.gather(*[tracker.counts_turn_async(**turn) for _, turn in turns]))
+        await ticks_meanwhile(tagging)
+        return(await tagging)
+    try:
+        results = asyncio.run(feeds())
+    finally:
+        model.pipe = pipe
+
+    assert len(ticks) > 10
+    assert max(after - before for before, after in zip(ticks, ticks[1:])) < 0.05 # never blocked for a whole call to spaCy
+    checks_metrics(expected, turns, results)
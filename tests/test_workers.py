@@ -0,0 +1,22 @@
+# Tests of the conversations processed in parallel (see runs_pipeline() with workers, or with an executor): same output as serially.
+import BME_Repetitions as bme
+from benchmarks.synthetic_corpus import generates_corpus
+
+
+def test_workers_give_the_serial_output(standin_model):
+    df = generates_corpus(conversations=6, turns=15, seed=11)
+    serial = bme.runs_pipeline(df, range(1, 4)).to_csv()
+
+    assert bme.runs_pipeline(df, range(1, 4), workers=2).to_csv() == serial
+
+
+def test_executor_reused_across_calls_gives_the_serial_output(standin_model):
+    df = generates_corpus(conversations=6, turns=15, seed=12)
+    serial = bme.runs_pipeline(df, range(1, 4)).to_csv()
+
+    # the conversations in two calls sharing the same worker processes, as streams_pipeline() does.
+    middle = df.index[df["Conv_MOD_P1_P2"] == df["Conv_MOD_P1_P2"].unique()[3]][0]
+    with bme.creates_executor(2) as executor:
+        first = bme.runs_pipeline(df.loc[:middle-1], range(1, 4), executor=executor)
+        second = bme.runs_pipeline(df.loc[middle:], range(1, 4), executor=executor, previous_line=first.iloc[-1:])
+    assert first.to_csv() + second.to_csv(header=False) == serial